@@ -0,0 +1,104 @@
+import re
+from dataclasses import dataclass, field, asdict
+
+# Outcomes of an adverse-media check
+HIT = "hit"
+NO_HIT = "no_hit"
+UNKNOWN = "unknown"
+
+# Structured fields the browse agent is asked to return alongside its answer.
+RESPONSE_TYPE = {
+    "type": "object",
+    "properties": {
+        "verdict": {
+            "type": "string",
+            "enum": ["Yes", "No"],
+            "required": True,
+            "description": "Yes if any adverse information about the person was found, otherwise No",
+        },
+        "confidence": {
+            "type": "number",
+            "description": "How confident you are in the verdict, from 0 to 1",
+        },
+        "summary": {
+            "type": "string",
+            "required": True,
+            "description": "A brief summary of the findings",
+        },
+        "sources": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "URLs of the pages the findings come from",
+        },
+    },
+}
+
+_leading_answer = re.compile(r"^\W*(yes|no)\b", re.IGNORECASE)
+
+
+@dataclass
+class AdverseMediaVerdict:
+    outcome: str = UNKNOWN
+    confidence: float = None
+    summary: str = ""
+    sources: list = field(default_factory=list)
+    method: str = "browse_agent"
+
+    @property
+    def has_adverse_media(self):
+        """True or False for a definite outcome, None when it needs review."""
+        if self.outcome == UNKNOWN:
+            return None
+        return self.outcome == HIT
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, bool):  # screening cache entries from before verdicts
+            return cls(outcome=HIT if data else NO_HIT)
+        return cls(**data)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _outcome(answer):
+    if not isinstance(answer, str):
+        return UNKNOWN
+    match = _leading_answer.match(answer)
+    if match is None:
+        return UNKNOWN
+    return HIT if match.group(1).lower() == "yes" else NO_HIT
+
+
+def parse_agent_result(result):
+    """
+    Turns a /browse response into a verdict.
+
+    Uses the structured fields requested through RESPONSE_TYPE, and falls back
+    to a Yes/No at the very start of the free-text result. Anything else is
+    UNKNOWN rather than guessed.
+    """
+    complete = result.get("objectiveComplete") if isinstance(result, dict) else None
+    if not isinstance(complete, dict):
+        return AdverseMediaVerdict()
+    outcome = _outcome(complete.get("verdict"))
+    if outcome == UNKNOWN:
+        outcome = _outcome(complete.get("result"))
+
+    confidence = complete.get("confidence")
+    if not isinstance(confidence, (int, float)) or isinstance(confidence, bool):
+        confidence = None
+    else:
+        confidence = min(max(float(confidence), 0.0), 1.0)
+
+    sources = complete.get("sources")
+    if not isinstance(sources, list):
+        sources = []
+
+    summary = complete.get("summary") or complete.get("result") or ""
+    return AdverseMediaVerdict(
+        outcome=outcome,
+        confidence=confidence,
+        summary=str(summary),
+        sources=[str(source) for source in sources],
+    )
@@ -0,0 +1,269 @@
+import os
+import io
+import json
+import time
+import glob
+import logging
+import argparse
+import requests
+import db
+from structured_logging import configure_logging
+from id_extraction import default_extractor, ExtractionError, OPENAI_BASE_URL
+
+# Re-extracts ID fields for stored ID photos through the OpenAI Batch API and
+# writes them back with batched Firestore writes. Progress is checkpointed
+# after every batch, so rerunning the same command after a crash resumes
+# where it stopped:
+#
+#   python3 backfill.py --dir ./photos
+#   python3 backfill.py --storage-prefix "" --base-url http://localhost:8080/v1
+
+logger = logging.getLogger("backfill")
+
+SUFFIX = "_id_document.jpg"
+FINISHED_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Batch input files may be at most 200 MB; leave room for the multipart upload.
+MAX_BATCH_BYTES = 190 * 1000 ** 2
+# Accounts looked up per read when matching photos to accounts.
+LOOKUP_CHUNK_SIZE = 500
+
+
+def account_id_from_name(name):
+    """The file name's prefix, which may be a Telegram user id rather than an account id."""
+    return os.path.basename(name)[: -len(SUFFIX)]
+
+
+def split_unmapped(items):
+    """Separates items whose prefix is an existing account from those that are not."""
+    mapped, unmapped = [], []
+    for start in range(0, len(items), LOOKUP_CHUNK_SIZE):
+        chunk = items[start:start + LOOKUP_CHUNK_SIZE]
+        accounts = db.get_accounts(account_id for account_id, _ in chunk)
+        for account_id, load in chunk:
+            if accounts[account_id] is None:
+                unmapped.append(account_id)
+            else:
+                mapped.append((account_id, load))
+    return mapped, unmapped
+
+
+def scan_directory(directory):
+    """Yields (account_id, loader) for every ID photo in a local directory."""
+    for path in sorted(glob.glob(os.path.join(directory, f"*{SUFFIX}"))):
+        def load(path=path):
+            with open(path, "rb") as f:
+                return f.read()
+        yield account_id_from_name(path), load
+
+
+def scan_storage(prefix):
+    """Yields (account_id, loader) for every ID photo in the configured file storage."""
+    for name, load in db.list_files(prefix):
+        if name.endswith(SUFFIX):
+            yield account_id_from_name(name), load
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"done": [], "failed": [], "pending_batch": None}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class BatchClient:
+    """Minimal client for the Files and Batch endpoints."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {os.getenv('OPENAI_API_KEY')}"
+
+    def submit(self, jsonl):
+        response = self.session.post(
+            f"{self.base_url}/files",
+            data={"purpose": "batch"},
+            files={"file": ("backfill.jsonl", io.BytesIO(jsonl), "application/jsonl")},
+        )
+        response.raise_for_status()
+        response = self.session.post(
+            f"{self.base_url}/batches",
+            json={
+                "input_file_id": response.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def wait(self, batch_id, poll_interval):
+        while True:
+            response = self.session.get(f"{self.base_url}/batches/{batch_id}")
+            response.raise_for_status()
+            batch = response.json()
+            if batch["status"] in FINISHED_STATUSES:
+                return batch
+            logger.info(
+                "Batch in progress",
+                extra={"batch_id": batch_id, "status": batch["status"], "request_counts": batch.get("request_counts")},
+            )
+            time.sleep(poll_interval)
+
+    def results(self, batch):
+        if not batch.get("output_file_id"):
+            return []
+        response = self.session.get(f"{self.base_url}/files/{batch['output_file_id']}/content")
+        response.raise_for_status()
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def build_batches(items, batch_size, max_bytes=MAX_BATCH_BYTES):
+    """
+    Yields (account_ids, jsonl) for batches of at most `batch_size` requests
+    and `max_bytes` of JSONL, loading each photo only when its line is built.
+    """
+    account_ids, lines, size = [], [], 0
+    for account_id, load in items:
+        line = json.dumps({
+            "custom_id": account_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": default_extractor.build_payload(load()),
+        }).encode()
+        if lines and (len(lines) == batch_size or size + 1 + len(line) > max_bytes):
+            yield account_ids, b"\n".join(lines)
+            account_ids, lines, size = [], [], 0
+        account_ids.append(account_id)
+        lines.append(line)
+        size += len(line) + (1 if len(lines) > 1 else 0)
+    if lines:
+        yield account_ids, b"\n".join(lines)
+
+
+def apply_results(results):
+    """Writes each successful extraction back; returns (done, failed, unmapped) ids."""
+    done, failed, unmapped = [], [], []
+    accounts = db.get_accounts(line["custom_id"] for line in results)
+    for line in results:
+        account_id = line["custom_id"]
+        # Writes merge, so a missing account would be silently created.
+        if accounts[account_id] is None:
+            logger.warning("No account, result not applied", extra={"account_id": account_id})
+            unmapped.append(account_id)
+            continue
+        response = line.get("response") or {}
+        try:
+            if response.get("status_code") != 200:
+                raise ExtractionError(line.get("error") or f"Request failed with status {response.get('status_code')}")
+            card = default_extractor.parse_response(response["body"])
+        except ExtractionError as e:
+            logger.warning("Extraction failed", extra={"account_id": account_id, "error": str(e)})
+            failed.append(account_id)
+            continue
+        db.update_id_fields(account_id, card.to_dict())
+        done.append(account_id)
+    # One round of batched writes for the whole batch.
+    db.flush_all()
+    return done, failed, unmapped
+
+
+def finish_batch(client, batch_id, checkpoint, checkpoint_path, poll_interval, report):
+    started = time.perf_counter()
+    batch = client.wait(batch_id, poll_interval)
+    report["wait_seconds"] += time.perf_counter() - started
+    if batch["status"] != "completed":
+        logger.warning("Batch did not complete", extra={"batch_id": batch_id, "status": batch["status"]})
+
+    started = time.perf_counter()
+    done, failed, unmapped = apply_results(client.results(batch))
+    report["apply_seconds"] += time.perf_counter() - started
+    report["succeeded"] += len(done)
+    report["failed"] += len(failed)
+    report["unmapped"].extend(unmapped)
+
+    checkpoint["done"].extend(done)
+    checkpoint["failed"].extend(failed)
+    checkpoint["pending_batch"] = None
+    save_checkpoint(checkpoint_path, checkpoint)
+
+
+def run(items, checkpoint_path, base_url, batch_size, poll_interval, retry_failed=False, max_batch_bytes=MAX_BATCH_BYTES):
+    checkpoint = load_checkpoint(checkpoint_path)
+    client = BatchClient(base_url)
+    report = {
+        "submitted": 0, "succeeded": 0, "failed": 0, "unmapped": [],
+        "build_seconds": 0.0, "wait_seconds": 0.0, "apply_seconds": 0.0,
+    }
+    started = time.perf_counter()
+
+    # A batch submitted before a crash is collected rather than resubmitted.
+    if checkpoint["pending_batch"]:
+        logger.info("Resuming batch", extra={"batch_id": checkpoint["pending_batch"]})
+        finish_batch(client, checkpoint["pending_batch"], checkpoint, checkpoint_path, poll_interval, report)
+
+    skip = set(checkpoint["done"])
+    if not retry_failed:
+        skip.update(checkpoint["failed"])
+    else:
+        checkpoint["failed"] = []
+    todo = [(account_id, load) for account_id, load in items if account_id not in skip]
+    # Older photos are named after the Telegram user id, not an account id.
+    todo, unmapped = split_unmapped(todo)
+    report["unmapped"].extend(unmapped)
+    if unmapped:
+        logger.warning("ID documents do not match an account and are skipped", extra={"count": len(unmapped)})
+    logger.info("Backfill starting", extra={"todo": len(todo), "already_handled": len(skip)})
+
+    batches = build_batches(todo, batch_size, max_batch_bytes)
+    while True:
+        build_started = time.perf_counter()
+        batch = next(batches, None)
+        report["build_seconds"] += time.perf_counter() - build_started
+        if batch is None:
+            break
+        account_ids, jsonl = batch
+
+        batch_id = client.submit(jsonl)
+        report["submitted"] += len(account_ids)
+        checkpoint["pending_batch"] = batch_id
+        save_checkpoint(checkpoint_path, checkpoint)
+        logger.info("Submitted batch", extra={"batch_id": batch_id, "requests": len(account_ids), "bytes": len(jsonl)})
+        finish_batch(client, batch_id, checkpoint, checkpoint_path, poll_interval, report)
+
+    report["elapsed_seconds"] = time.perf_counter() - started
+    processed = report["succeeded"] + report["failed"]
+    report["documents_per_second"] = processed / report["elapsed_seconds"] if report["elapsed_seconds"] else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill ID fields through the OpenAI Batch API.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help=f"Local directory of *{SUFFIX} files.")
+    source.add_argument("--storage-prefix", help="Storage object prefix to scan.")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json")
+    parser.add_argument("--base-url", default=OPENAI_BASE_URL)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--max-batch-bytes", type=int, default=MAX_BATCH_BYTES)
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--retry-failed", action="store_true", help="Retry documents that failed in earlier runs.")
+    args = parser.parse_args()
+    configure_logging()
+
+    items = scan_directory(args.dir) if args.dir is not None else scan_storage(args.storage_prefix)
+    report = run(
+        items, args.checkpoint, args.base_url, args.batch_size, args.poll_interval,
+        args.retry_failed, args.max_batch_bytes,
+    )
+    logger.info("Backfill finished", extra=report)
+
+
+if __name__ == "__main__":
+    main()
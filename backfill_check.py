@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+from aiohttp import web
+import db
+import backfill
+from db_backends import MemoryBackend
+from openai_stub import make_app
+
+# Runs backfill.py end to end against openai_stub.py and an in-memory database,
+# crashing it after the first batch is submitted, and checks that a rerun
+# collects that batch instead of resubmitting it and finishes the rest:
+#
+#   python3 backfill_check.py --documents 5 --batch-size 2
+
+PHOTO = "echBC6Ff0D587NsNq0Zt_id_document.jpg"
+
+
+class Crash(Exception):
+    """Stands in for the process dying while a batch is in flight."""
+
+
+def serve_stub(response_path):
+    """Serves the OpenAI stub from a background thread; returns its base URL."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(make_app(response_path), access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check backfill checkpoint/resume against the OpenAI stub.")
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--response", default="rando.json")
+    args = parser.parse_args()
+
+    base_url = serve_stub(args.response)
+    db.init(backend=MemoryBackend())
+    with open(PHOTO, "rb") as f:
+        photo = f.read()
+
+    submitted = []
+    submit = backfill.BatchClient.submit
+
+    def counting_submit(self, jsonl):
+        batch_id = submit(self, jsonl)
+        submitted.append(batch_id)
+        return batch_id
+
+    backfill.BatchClient.submit = counting_submit
+
+    with tempfile.TemporaryDirectory() as directory:
+        account_ids = []
+        for _ in range(args.documents):
+            account_id = db.create_new_account()
+            db.update_name(account_id, "Backfill Check")
+            account_ids.append(account_id)
+        # Named after a Telegram user id, as older photos are.
+        names = account_ids + ["7407996533"]
+        for name in names:
+            with open(os.path.join(directory, f"{name}{backfill.SUFFIX}"), "wb") as f:
+                f.write(photo)
+        checkpoint_path = os.path.join(directory, "checkpoint.json")
+
+        def run():
+            items = backfill.scan_directory(directory)
+            return backfill.run(items, checkpoint_path, base_url, args.batch_size, poll_interval=0.1)
+
+        results = backfill.BatchClient.results
+
+        def crashing_results(self, batch):
+            raise Crash()
+
+        backfill.BatchClient.results = crashing_results
+        try:
+            run()
+            raise AssertionError("the first run should have crashed")
+        except Crash:
+            pass
+        finally:
+            backfill.BatchClient.results = results
+
+        checkpoint = backfill.load_checkpoint(checkpoint_path)
+        assert checkpoint["pending_batch"] == submitted[0], checkpoint
+        assert checkpoint["done"] == [], checkpoint
+
+        report = run()
+        expected_batches = -(-args.documents // args.batch_size)
+        assert len(submitted) == expected_batches, f"{len(submitted)} batches submitted, expected {expected_batches}"
+        assert report["unmapped"] == ["7407996533"], report
+        checkpoint = backfill.load_checkpoint(checkpoint_path)
+        assert sorted(checkpoint["done"]) == sorted(account_ids), checkpoint
+        assert checkpoint["pending_batch"] is None, checkpoint
+        for account_id in account_ids:
+            assert db.get_account(account_id).get("id_fields"), f"no id_fields on {account_id}"
+
+        # Everything is checkpointed, so a third run submits nothing.
+        report = run()
+        assert report["submitted"] == 0 and len(submitted) == expected_batches, report
+
+    # Batches are also cut by size, not just by count.
+    items = [(account_id, lambda: photo) for account_id in account_ids]
+    line_size = len(next(backfill.build_batches(items[:1], 1))[1])
+    batches = list(backfill.build_batches(items, len(items), max_bytes=line_size * 2 + 1))
+    assert all(len(jsonl) <= line_size * 2 + 1 for _, jsonl in batches), [len(jsonl) for _, jsonl in batches]
+    assert [len(ids) for ids, _ in batches] == [2] * (len(items) // 2) + [1] * (len(items) % 2)
+
+    db.shutdown()
+    print(json.dumps({"batches_submitted": len(submitted), "documents": args.documents, "ok": True}))
+
+
+if __name__ == "__main__":
+    main()
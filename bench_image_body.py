@@ -0,0 +1,59 @@
+import json
+import argparse
+import tracemalloc
+import image_preprocessing
+from id_extraction import default_extractor
+
+# Peak memory of building and sending vision requests, inline JSON versus the
+# streaming base64 body, for several extractions in flight at once.
+#
+#   python3 bench_image_body.py --image echBC6Ff0D587NsNq0Zt_id_document.jpg --concurrency 8
+
+
+def inline_bodies(images):
+    # What aiohttp's json= does: serialize to str, then encode to bytes.
+    bodies = [json.dumps(default_extractor.build_payload(image)).encode() for image in images]
+    return sum(len(body) for body in bodies)
+
+
+def streaming_bodies(images):
+    bodies = [default_extractor.build_body(image) for image in images]
+    sent = 0
+    # Interleave the writers, as concurrent requests would.
+    for chunks in zip(*(iter(body) for body in bodies)):
+        sent += sum(len(chunk) for chunk in chunks)
+    return sent
+
+
+def measure(build, images):
+    tracemalloc.start()
+    size = build(images)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of vision request bodies.")
+    parser.add_argument("--image", default="echBC6Ff0D587NsNq0Zt_id_document.jpg")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    # Measure the request bodies alone, not Pillow's decode and re-encode.
+    image_preprocessing.ENABLED = False
+
+    with open(args.image, "rb") as f:
+        image = f.read()
+    # Each in-flight extraction holds its own copy of the photo.
+    images = [bytearray(image) for _ in range(args.concurrency)]
+
+    print(f"{len(image)} byte image, {args.concurrency} concurrent extractions")
+    for name, build in (("inline json", inline_bodies), ("streaming", streaming_bodies)):
+        size, peak = measure(build, images)
+        print(
+            f"{name:<12} body {size / args.concurrency / 1e6:.2f} MB, "
+            f"peak {peak / 1e6:.2f} MB ({peak / args.concurrency / 1e6:.2f} MB per extraction)"
+        )
+
+
+if __name__ == "__main__":
+    main()
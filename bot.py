@@ -10,44 +10,84 @@ from telegram.ext import (
     CallbackContext,
 )
 from dotenv import load_dotenv
-from db import (
+from db_async import (
     create_new_account,
     update_name,
     update_address,
     update_email,
     update_ssn,
-    update_id,
-    upload_file_to_storage,
-    update_id_fields,
-    update_adverse_media_check
+    upload_bytes_to_storage,
+    update_id_document,
+    update_adverse_media_check,
+    flush_account,
+    get_account,
+    init as init_db,
+    shutdown as shutdown_db,
 )
-from helpers import encode_image
-from openai import query_openai_with_image
+import extraction_cache
+import screening_cache
+import watchlist
+from watchlist import default_watchlist
+import jobs
+import metrics
+from metrics import METRICS_PORT
+from persistence import SharedConversationHandler, make_persistence
+from id_extraction import default_extractor
 import asyncio
-import aiohttp
-import requests
+import time
 from helpers import validate_ssn
-import json
+from http_client import open_session, close_session
+import browse_agent
+import adverse_media
+from adverse_media import AdverseMediaVerdict, parse_agent_result
+import email_validation
+from email_validation import validate_email
+from structured_logging import configure_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+configure_logging()
+logger = logging.getLogger("bot")
 
 # Define states
 NAME, ADDRESS, EMAIL, SSN, ID_DOCUMENT = range(5)
 
 
+# What to ask for when an applicant resumes at each step
+RESUME_PROMPTS = {
+    ID_DOCUMENT: "Please upload your ID document.",
+    EMAIL: "Please provide your email.",
+    SSN: "Please provide your SSN. We'll encrypt it for security.",
+}
+
+
 # Define the start command handler
+@metrics.timed("handler")
 async def start(update: Update, context: CallbackContext) -> int:
+    # An unfinished application (e.g. interrupted by a restart) is resumed on
+    # its existing account instead of creating a duplicate one. Finished ones
+    # are dropped from user_data; "completed" covers entries saved before that.
+    if "account_id" in context.user_data and not context.user_data.get("completed"):
+        step = context.user_data.get("step", ID_DOCUMENT)
+        # The photo is processed in the background after the reply, so a
+        # crash can lose it; ask again unless it is actually stored.
+        if step != ID_DOCUMENT:
+            account = await get_account(context.user_data["account_id"]) or {}
+            if "id_" not in account or "id_fields" not in account:
+                step = context.user_data["step"] = ID_DOCUMENT
+        await update.message.reply_text(
+            f"Welcome back! Let's pick up where you left off. {RESUME_PROMPTS[step]}"
+        )
+        return step
+
     await update.message.reply_text(
         "Hi! I'll be your onboarding buddy for today. Please upload your ID document to start."
     )
-    context.user_data["account_id"] = create_new_account()
+    context.user_data.clear()
+    context.user_data["account_id"] = await create_new_account()
+    context.user_data["step"] = ID_DOCUMENT
 
     return ID_DOCUMENT
 
@@ -63,126 +103,123 @@ async def start(update: Update, context: CallbackContext) -> int:
 #     return EMAIL
 
 
+@metrics.timed("job", "adverse_media")
 async def post_name_and_address(user_data):
-
-    async with aiohttp.ClientSession() as session:
-        web_search_result = await web_search(user_data)
-
-        # Call the update_adverse_media_check function
-        update_adverse_media_check(user_data['account_id'], web_search_result)
-
+    # Screen against the local watchlist first; only names it cannot clearly
+    # clear or match go to the (much slower) browse agent.
+    screening, score, match = default_watchlist.screen_name(user_data["name"])
+    if len(default_watchlist) and screening != watchlist.AMBIGUOUS:
+        logger.info(
+            "Watchlist screening result",
+            extra={"account_id": user_data["account_id"], "result": screening, "score": round(score, 2)},
+        )
+        verdict = AdverseMediaVerdict(
+            outcome=adverse_media.HIT if screening == watchlist.HIT else adverse_media.NO_HIT,
+            confidence=score if screening == watchlist.HIT else 1 - score,
+            summary=f"Closest watchlist entry: {match[0]}" if match else "",
+            sources=[match[1]] if match else [],
+            method="watchlist",
+        )
+    else:
+        cached = await screening_cache.screen(
+            user_data["name"],
+            user_data["address"],
+            lambda: web_search(user_data),
+            # Inconclusive crawls are worth retrying next time
+            should_cache=lambda result: result["outcome"] != adverse_media.UNKNOWN,
+        )
+        if cached is None:
+            # No readable name on the ID: nothing to screen, so a person has to look
+            logger.warning("No name to screen", extra={"account_id": user_data["account_id"]})
+            verdict = AdverseMediaVerdict(summary="No readable name on the ID document")
+        else:
+            verdict = AdverseMediaVerdict.from_dict(cached)
+
+    metrics.outcomes.inc(outcome=f"adverse_media_{verdict.outcome}")
+
+    # Call the update_adverse_media_check function; an unknown outcome (the
+    # agent failed or gave no usable answer) leaves the account pending review
+    await update_adverse_media_check(
+        user_data['account_id'], verdict.has_adverse_media, verdict.to_dict()
+    )
 
 
 async def web_search(user_data):
-    async with aiohttp.ClientSession() as session:
-        payload = {
-            "browse_config": {
-                "startUrl": "https://google.com",
-                "objective": [
-                    f"Find information about {user_data['name']} who lives around {user_data['address']}. If no evidence is found, just say No, if some evidence is found, just say Yes and provide a brief summary."
-                ],
-                "maxIterations": 10,
-            },
-            "provider_config": {
-                "provider": "openai",
-                "apiKey": os.getenv("OPENAI_API_KEY"),
-            },
-            "model_config": {"model": "gpt-4", "temperature": 0},
-            "response_type": {
-                "type": "object",
-                "properties": {
-                    "summary": {
-                        "type": "string",
-                        "required": True,
-                        "description": "A brief summary of the findings",
-                    }
-                },
-            },
-            "inventory": [
-                {"name": "PersonName", "value": user_data["name"], "type": "string"},
-                {
-                    "name": "PersonAddress",
-                    "value": user_data["address"],
-                    "type": "string",
-                },
+    """Runs the browse agent and returns its verdict as a dict."""
+    payload = {
+        "browse_config": {
+            "startUrl": "https://google.com",
+            "objective": [
+                f"Find information about {user_data['name']} who lives around {user_data['address']}. If no evidence is found, just say No, if some evidence is found, just say Yes and provide a brief summary."
             ],
-            "headless": True,
-            "hdr_config": {
-                "apikey": os.getenv("HDR_API_KEY"),
-                "endpoint": "https://api.hdr.is",
+            "maxIterations": 10,
+        },
+        "provider_config": {
+            "provider": "openai",
+            "apiKey": os.getenv("OPENAI_API_KEY"),
+        },
+        "model_config": {"model": "gpt-4", "temperature": 0},
+        "response_type": adverse_media.RESPONSE_TYPE,
+        "inventory": [
+            {"name": "PersonName", "value": user_data["name"], "type": "string"},
+            {
+                "name": "PersonAddress",
+                "value": user_data["address"],
+                "type": "string",
             },
-        }
-        async with session.post(
-            "http://localhost:3000/browse", json=payload
-        ) as response:
-            if response.status == 200:
-                result = await response.json()
-                if (
-                    "objectiveComplete" in result
-                    and "result" in result["objectiveComplete"]
-                ):
-                    search_result = result["objectiveComplete"]["result"]
-                    if "Yes" in search_result:
-                        print("Web search result: Information found")
-                        return True
-                    elif "No" in search_result:
-                        print("Web search result: No information found")
-                        return False
-                    else:
-                        print("Web search result: Unexpected response")
-                        return False
-                else:
-                    print(
-                        "Web search result: No relevant information found in the response"
-                    )
-                    return False
-            else:
-                print(f"Web search request failed with status: {response.status}")
-                return False
+        ],
+        "headless": True,
+        "hdr_config": {
+            "apikey": os.getenv("HDR_API_KEY"),
+            "endpoint": "https://api.hdr.is",
+        },
+    }
+    try:
+        result = await browse_agent.browse(payload)
+    except browse_agent.AgentUnavailable as e:
+        logger.warning("Web search request failed: %s", e, extra={"account_id": user_data["account_id"]})
+        return AdverseMediaVerdict(summary=str(e)).to_dict()
+
+    verdict = parse_agent_result(result)
+    logger.info("Web search result", extra={"account_id": user_data["account_id"], "outcome": verdict.outcome})
+    return verdict.to_dict()
 
 
 # Define the email handler
+@metrics.timed("handler")
 async def email(update: Update, context: CallbackContext) -> int:
     context.user_data["email"] = update.message.text
-    update_email(context.user_data["account_id"], context.user_data["email"])
+    await update_email(context.user_data["account_id"], context.user_data["email"])
 
-    api_key = os.getenv("ABSTRACT_API_KEY")
-    response = requests.get(
-        f"https://emailvalidation.abstractapi.com/v1/?api_key={api_key}&email={context.user_data['email']}"
-    )
+    verdict = await validate_email(context.user_data["email"])
+    metrics.outcomes.inc(outcome=f"email_{verdict}")
 
-    if response.status_code != 200:
+    if verdict == email_validation.ERROR:
         await update.message.reply_text(
             "There was an error validating your email. Please try again."
         )
         return EMAIL
 
-    email_data = response.json()
-
-    # Check email validation fields
-    if (
-        not email_data["is_valid_format"]["value"]
-        or not email_data["is_mx_found"]["value"]
-        or not email_data["is_smtp_valid"]["value"]
-    ):
+    if verdict == email_validation.INVALID:
         await update.message.reply_text(
             "Oops! Looks like this email is invalid. Please provide a valid email address."
         )
         return EMAIL
 
-    if email_data["deliverability"] == "UNDELIVERABLE":
+    if verdict == email_validation.UNDELIVERABLE:
         await update.message.reply_text(
             "We see that the email address is undeliverable. Please provide a valid email address to ensure you can receive our communications!"
         )
         return EMAIL
 
-    if email_data["is_disposable_email"]["value"]:
+    if verdict == email_validation.DISPOSABLE:
         await update.message.reply_text(
             "Sorry, disposable email addresses are not allowed. Please provide a valid email address."
         )
         return EMAIL
 
     # If all checks pass, proceed to the next step
+    context.user_data["step"] = SSN
     await update.message.reply_text(
         "Got it. Next, please provide your SSN. We'll encrypt it for security."
     )
@@ -190,10 +227,13 @@ async def email(update: Update, context: CallbackContext) -> int:
 
 
 # Define the SSN handler
+@metrics.timed("handler")
 async def ssn(update: Update, context: CallbackContext) -> int:
-    context.user_data["ssn"] = update.message.text
-    update_ssn(context.user_data["account_id"], context.user_data["ssn"])
-    if not validate_ssn(context.user_data["ssn"]):
+    # Kept out of user_data so the SSN is never written to conversation state
+    ssn_number = update.message.text
+    await update_ssn(context.user_data["account_id"], ssn_number)
+    if not validate_ssn(ssn_number):
+        metrics.outcomes.inc(outcome="ssn_invalid")
         await update.message.reply_text("Please provide a valid SSN.")
         return SSN
     await update.message.delete()
@@ -204,117 +244,107 @@ async def ssn(update: Update, context: CallbackContext) -> int:
         f"Email: {context.user_data['email']}\n"
         "ID Document: Saved"
     )
+    metrics.outcomes.inc(outcome="onboarding_completed")
+    await flush_account(context.user_data["account_id"])
+    # Nothing left to resume; don't keep the applicant's details in bot state
+    context.application.drop_user_data(update.effective_user.id)
     return ConversationHandler.END
 
 
-async def process_id_document(photo_path, account_id):
+async def extract_id_fields(image_bytes, account_id=None):
     """
-    Processes an ID document by encoding the image and querying the OpenAI API.
+    Extracts the ID fields from a photo, reusing a cached extraction when the
+    same photo (or, within one account, a nearly identical one) has been seen
+    before.
 
     Args:
-    - photo_path (str): Path to the photo file.
-    - account_id (str): The account ID associated with this document.
+    - image_bytes (bytes): The downloaded photo.
+    - account_id (str): The account the photo belongs to.
 
     Returns:
-    - dict: The JSON response from the OpenAI API.
+    - dict: The parsed ID fields.
     """
-    encoded_img = encode_image(photo_path)
-    api_key = os.getenv("OPENAI_API_KEY")
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-
-    payload = {
-        "model": "gpt-4o",
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": """Please process this image and output the following in JSON:
-
-                        idNumber (string)
-                        name (string)
-                        birthdate (string)
-                        sex (string)
-                        address (string)
-                        electronicReplicaOfID (boolean)
-                        paperReplicaOfID (boolean)
-                        pictureIsClear (boolean)
-                        idImageIsTampered (boolean)
-                        """,
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{encoded_img}"},
-                    },
-                ],
-            }
-        ],
-        "max_tokens": 300,
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            "https://api.openai.com/v1/chat/completions", headers=headers, json=payload
-        ) as response:
-            result = await response.json()
-
-    # Process the response here
-    print(result)
+    version = default_extractor.version
+    content_hash, phash = await asyncio.to_thread(extraction_cache.hash_image, image_bytes, version)
+    card_parsed = await asyncio.to_thread(extraction_cache.lookup, content_hash, phash, account_id, version)
+    if card_parsed is None:
+        card_parsed = (await default_extractor.extract(image_bytes)).to_dict()
+        await asyncio.to_thread(extraction_cache.store, content_hash, phash, card_parsed, account_id, version)
+    else:
+        logger.info("ID extraction served from cache")
+        metrics.outcomes.inc(outcome="extraction_cache_hit")
+    return card_parsed
 
-    # Update the user's data with the verification results
-    # This is a placeholder - implement according to your needs
-    # update_verification_results(account_id, result)
 
-    # Parse the outer JSON
+@metrics.timed("job")
+async def process_id_document(image_bytes, account_id, received_at=None):
+    """
+    Processes an ID document: uploads the photo and extracts its fields
+    concurrently from the same buffer, then saves both in a single write.
 
-    # Extract the content field
-    content_string = result["choices"][0]["message"]["content"]
+    Args:
+    - image_bytes (bytes): The downloaded photo.
+    - account_id (str): The account ID associated with this document.
+    - received_at (float): time.perf_counter() when the photo arrived, used to
+      report end-to-end latency.
 
-    # Parse the content field
-    card_parsed = json.loads(content_string)
+    Returns:
+    - dict: The parsed ID fields.
+    """
+    file_name = f"{account_id}_id_document.jpg"
+    file_url, card_parsed = await asyncio.gather(
+        upload_bytes_to_storage(image_bytes, file_name),
+        extract_id_fields(image_bytes, account_id),
+    )
 
-    # Now you can access the parsed content
-    print(json.dumps(card_parsed, indent=2))
+    if card_parsed.get("idImageIsTampered"):
+        metrics.outcomes.inc(outcome="id_tampered")
+    if not card_parsed.get("pictureIsClear"):
+        metrics.outcomes.inc(outcome="id_picture_unclear")
 
-    # You can also access individual fields, for example:
-    print(f"Name: {card_parsed['name']}")
-    print(f"Birthdate: {card_parsed['birthdate']}")
+    # Save the image url and the ID fields in the database together
+    await update_id_document(account_id, file_url, card_parsed)
 
-    # Call the post_name_and_address function with data from card_parsed
-    asyncio.create_task(
-        post_name_and_address(
-            {"name": card_parsed["name"], "address": card_parsed["address"], "account_id": account_id}
-        )
+    # Queue the adverse media check with data from card_parsed
+    await jobs.submit(
+        "web_search",
+        {"name": card_parsed["name"], "address": card_parsed["address"], "account_id": account_id},
     )
 
-    # Update the ID fields in the database
-    update_id_fields(account_id, card_parsed)
-
-    # Update the user's data with the verification results
-    # This is a placeholder - implement according to your needs
-    # update_verification_results(account_id, result)
-    return result
+    if received_at is not None:
+        logger.info(
+            "ID document processed",
+            extra={"account_id": account_id, "duration_ms": round((time.perf_counter() - received_at) * 1000)},
+        )
+    return card_parsed
 
 
 # Define the ID document handler
+@metrics.timed("handler")
 async def id_document(update: Update, context: CallbackContext) -> int:
     if update.message.photo:
+        received_at = time.perf_counter()
         photo_file = await update.message.photo[-1].get_file()
-        photo_path = f"{update.message.from_user.id}_id_document.jpg"
-        await photo_file.download_to_drive(photo_path)
-        file_url = upload_file_to_storage(photo_path, os.path.basename(photo_path))
-        update_id(context.user_data["account_id"], file_url)
-
-        # Start the ID verification process in the background
-        asyncio.create_task(
-            process_id_document(photo_path, context.user_data["account_id"])
-        )
+        # Keep the photo in memory; the same buffer feeds both the upload
+        # and the vision request.
+        image_bytes = await photo_file.download_as_bytearray()
 
+        # Reply first; the upload and extraction run in the background
+        context.user_data["step"] = EMAIL
         await update.message.reply_text(
             "ID document received! Please provide your email."
         )
+        logger.info(
+            "ID document acknowledged",
+            extra={
+                "account_id": context.user_data["account_id"],
+                "duration_ms": round((time.perf_counter() - received_at) * 1000),
+            },
+        )
+
+        await jobs.submit(
+            "process_id_document", image_bytes, context.user_data["account_id"], received_at
+        )
         return EMAIL
     else:
         await update.message.reply_text("Please send a photo of your ID document.")
@@ -322,24 +352,54 @@ async def id_document(update: Update, context: CallbackContext) -> int:
 
 
 # Define the cancel handler
+@metrics.timed("handler")
 async def cancel(update: Update, context: CallbackContext) -> int:
     await update.message.reply_text("Conversation cancelled.")
+    if "account_id" in context.user_data:
+        await flush_account(context.user_data["account_id"])
+    context.application.drop_user_data(update.effective_user.id)
     return ConversationHandler.END
 
 
-def main() -> None:
-    """Run the bot."""
-    # Get the bot's token from the environment variable
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        logger.error("No TELEGRAM_BOT_TOKEN found in environment variables.")
-        return
+async def post_init(application: Application) -> None:
+    # Connect to Firebase before the first applicant arrives, not during it
+    await init_db()
+    await open_session()
+    # Webhook workers serve /metrics from their own ASGI app instead
+    if METRICS_PORT and not os.getenv("WEBHOOK_URL"):
+        await metrics.start_server(METRICS_PORT)
+    jobs.register("process_id_document", process_id_document, concurrency=4)
+    jobs.register("web_search", post_name_and_address, concurrency=2, max_retries=1)
 
-    # Create the Application and pass it your bot's token
-    application = Application.builder().token(token).build()
+
+async def post_shutdown(application: Application) -> None:
+    await jobs.drain_all()
+    await close_session()
+    await metrics.stop_server()
+
+
+def build_application(token, persistence=None, request=None):
+    """
+    Creates the Application and its conversation handler. `request` replaces
+    the Bot API transport (e.g. with a fake for load tests).
+
+    Returns:
+    - tuple: (application, conversation handler).
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
 
     # Define the conversation handler
-    conv_handler = ConversationHandler(
+    conv_handler = SharedConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
             # ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, address)],
@@ -348,13 +408,39 @@ def main() -> None:
             SSN: [MessageHandler(filters.TEXT & ~filters.COMMAND, ssn)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        allow_reentry=True,
+        name="onboarding",
+        persistent=persistence is not None,
     )
 
     application.add_handler(conv_handler)
+    return application, conv_handler
+
+
+def main() -> None:
+    """Run the bot."""
+    # Get the bot's token from the environment variable
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        logger.error("No TELEGRAM_BOT_TOKEN found in environment variables.")
+        return
+
+    # With WEBHOOK_URL set, serve updates from an ASGI app instead of polling
+    if os.getenv("WEBHOOK_URL"):
+        from webhook import run_webhook
+
+        run_webhook(token)
+        return
+
+    # Create the Application and pass it your bot's token
+    application, _ = build_application(token, make_persistence())
 
     # Run the bot until the user presses Ctrl-C
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
+    # Write out anything still buffered before the process exits
+    shutdown_db()
+
 
 if __name__ == "__main__":
     main()
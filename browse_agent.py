@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import aiohttp
+import metrics
+from http_client import get_session
+
+BROWSE_AGENT_URL = os.getenv("BROWSE_AGENT_URL", "http://localhost:3000/browse")
+# A 10-iteration crawl normally finishes well within this.
+DEADLINE_SECONDS = float(os.getenv("BROWSE_AGENT_DEADLINE_SECONDS", "180"))
+FAILURE_THRESHOLD = int(os.getenv("BROWSE_AGENT_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT_SECONDS = float(os.getenv("BROWSE_AGENT_RESET_TIMEOUT_SECONDS", "60"))
+
+
+class AgentUnavailable(Exception):
+    """Raised when the browse agent could not produce a result."""
+
+
+class CircuitOpen(AgentUnavailable):
+    """Raised without calling the agent while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast. Once `reset_timeout` seconds have passed a single trial call is
+    let through; its success closes the circuit, its failure reopens it.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_running or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release(self):
+        """Gives back a trial slot when a call ended without a verdict (cancelled)."""
+        self._trial_running = False
+
+
+breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT_SECONDS)
+
+circuit_open = metrics.Gauge("kyc_browse_agent_circuit_open", "1 while the browse agent circuit breaker is open.")
+metrics.register_collector(lambda: circuit_open.set(int(breaker.state == "open")))
+
+
+@metrics.timed("outbound", "browse_agent")
+async def browse(payload, deadline=DEADLINE_SECONDS):
+    """
+    Runs a browse-agent session.
+
+    The call is abandoned (and its connection closed) after `deadline`
+    seconds, and cancelling the calling task cancels the request.
+
+    Args:
+    - payload (dict): The /browse request body.
+    - deadline (float): Seconds to wait for the agent.
+
+    Returns:
+    - dict: The agent's JSON response.
+
+    Raises:
+    - AgentUnavailable: On timeout, a non-200 response, a connection error or
+      while the circuit breaker is open.
+    """
+    if not breaker.allow():
+        raise CircuitOpen("Browse agent circuit is open")
+    try:
+        async with asyncio.timeout(deadline):
+            async with get_session().post(BROWSE_AGENT_URL, json=payload) as response:
+                if response.status != 200:
+                    raise AgentUnavailable(f"Browse agent returned status {response.status}")
+                result = await response.json()
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except TimeoutError:
+        breaker.record_failure()
+        raise AgentUnavailable(f"Browse agent did not answer within {deadline:.0f}s")
+    except (aiohttp.ClientError, ValueError) as e:
+        breaker.record_failure()
+        raise AgentUnavailable(f"Browse agent request failed: {e}")
+    except Exception:
+        # Includes AgentUnavailable and anything unexpected (e.g. the session
+        # being closed at shutdown), so a trial call never keeps its slot.
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
@@ -1,56 +1,178 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+import os
+import logging
+import threading
 from datetime import datetime
+import db_backends
 
-cred = credentials.Certificate('./credentials.json')
-firebase_admin.initialize_app(cred, {
-    'storageBucket': 'fast-kyc.appspot.com'
-})
+logger = logging.getLogger(__name__)
 
-db = firestore.client()
+# The backend (Firestore, SQLite or in-memory, see db_backends) is only built
+# on first use or by an explicit init(), so importing this module stays cheap
+# and does not need credentials.
+_backend = None
+_init_lock = threading.Lock()
 
-bucket = storage.bucket()
+def init(client=None, bucket=None, backend=None):
+    """
+    Sets up the storage backend, once.
+
+    Args:
+    - client: A Firestore client (or compatible fake) for a Firestore backend.
+    - bucket: A Storage bucket (or compatible fake) for a Firestore backend.
+    - backend: A ready-made backend; otherwise DB_BACKEND picks one.
+    """
+    global _backend
+    with _init_lock:
+        if backend is not None:
+            _backend = backend
+        elif client is not None or bucket is not None:
+            _backend = db_backends.FirestoreBackend(client, bucket)
+        elif _backend is None:
+            _backend = db_backends.make_backend()
+        else:
+            return
+        logger.info("Database backend initialized", extra={'backend': type(_backend).__name__})
+
+def get_backend():
+    """Returns the storage backend, initializing it if needed."""
+    if _backend is None:
+        init()
+    return _backend
+
+def shutdown():
+    """Writes out anything still buffered and closes the backend."""
+    global _backend
+    flush_all()
+    with _init_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = None
+
+# Field updates are buffered per account and committed together as a single
+# backend write (one WriteBatch on Firestore), either once enough fields are
+# pending or after a short delay.
+FLUSH_MAX_FIELDS = int(os.getenv('DB_FLUSH_MAX_FIELDS', '20'))
+FLUSH_INTERVAL_SECONDS = float(os.getenv('DB_FLUSH_INTERVAL_SECONDS', '2.0'))
+# A failed flush keeps its fields buffered and is retried with exponential
+# backoff, up to this long between attempts.
+FLUSH_MAX_RETRY_SECONDS = float(os.getenv('DB_FLUSH_MAX_RETRY_SECONDS', '60'))
+# Firestore rejects batches with more than 500 writes.
+MAX_BATCH_WRITES = 500
+
+_pending_updates = {}
+_pending_lock = threading.Lock()
+_flush_timer = None
+_flush_failures = 0
+
+def _schedule_flush(delay):
+    """Starts the flush timer; the caller holds _pending_lock."""
+    global _flush_timer
+    _flush_timer = threading.Timer(delay, _timed_flush)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+def _timed_flush():
+    # Runs on the timer thread, where an exception would only reach stderr.
+    try:
+        flush_all()
+    except Exception:
+        logger.exception("Buffered write failed, will retry", extra={'failures': _flush_failures})
+
+def buffer_update(account_id, fields):
+    """Queue field updates for an account to be written with the next flush."""
+    with _pending_lock:
+        _pending_updates.setdefault(account_id, {}).update(fields)
+        pending_fields = sum(len(f) for f in _pending_updates.values())
+        flush_now = pending_fields >= FLUSH_MAX_FIELDS
+        if not flush_now and _flush_timer is None:
+            _schedule_flush(FLUSH_INTERVAL_SECONDS)
+    if flush_now:
+        flush_all()
+
+def _commit(updates):
+    global _flush_failures
+    items = list(updates.items())
+    try:
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            get_backend().write_accounts(dict(items[start:start + MAX_BATCH_WRITES]))
+    except Exception:
+        # Put the unwritten fields back, without clobbering anything newer,
+        # and make sure another attempt is coming.
+        with _pending_lock:
+            for account_id, fields in items[start:]:
+                _pending_updates[account_id] = {**fields, **_pending_updates.get(account_id, {})}
+            _flush_failures += 1
+            if _flush_timer is None:
+                _schedule_flush(min(FLUSH_INTERVAL_SECONDS * 2 ** _flush_failures, FLUSH_MAX_RETRY_SECONDS))
+        raise
+    _flush_failures = 0
+    logger.debug("Flushed buffered writes", extra={'accounts': len(items)})
+
+def flush_account(account_id):
+    """Synchronously write any buffered fields for one account."""
+    with _pending_lock:
+        fields = _pending_updates.pop(account_id, None)
+    if fields:
+        _commit({account_id: fields})
+
+def flush_all():
+    """Synchronously write every buffered field update."""
+    global _flush_timer
+    with _pending_lock:
+        updates = dict(_pending_updates)
+        _pending_updates.clear()
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+    if updates:
+        _commit(updates)
 
 def create_new_account():
-    doc_ref = db.collection('accounts').add({
-        'created_at': datetime.now().isoformat()
-    })
-    print("New account created with id {0} at {1}.".format(doc_ref[1].id, datetime.now().isoformat()))
-    return doc_ref[1].id
+    # The document id is generated client side, so creation rides along with
+    # the account's first batch instead of costing its own round trip.
+    account_id = get_backend().new_account_id()
+    buffer_update(account_id, {'created_at': datetime.now().isoformat()})
+    logger.info("New account created", extra={'account_id': account_id})
+    return account_id
 
 def upload_file_to_storage(file_path, file_name):
-    blob = bucket.blob(file_name)
     with open(file_path, "rb") as file:
-        blob.upload_from_file(file, content_type='image/jpeg')
-    print("File {0} uploaded.".format(file_name))
-    return blob.public_url
+        return upload_bytes_to_storage(file.read(), file_name)
+
+def upload_bytes_to_storage(data, file_name, content_type=None):
+    public_url, uploaded = get_backend().upload_bytes(data, file_name, content_type)
+    if uploaded:
+        logger.info("File uploaded", extra={'file_name': file_name})
+    else:
+        logger.info("File unchanged, upload skipped", extra={'file_name': file_name})
+    return public_url
 
 def create_idv_results(account_id, idv_results):
-    db.collection('accounts').document(account_id).update({'idv_results': idv_results})
-    print("IDV results created for account {0}.".format(account_id))
+    buffer_update(account_id, {'idv_results': idv_results})
+    logger.debug("IDV results created", extra={'account_id': account_id})
 
 def update_name(account_id, name):
-    db.collection('accounts').document(account_id).update({'name': name})
-    print("Name updated for account {0} to {1}.".format(account_id, name))
+    buffer_update(account_id, {'name': name})
+    logger.debug("Name updated", extra={'account_id': account_id})
 
 def update_address(account_id, address):
-    db.collection('accounts').document(account_id).update({'address': address})
-    print("Address updated for account {0} to {1}.".format(account_id, address))
+    buffer_update(account_id, {'address': address})
+    logger.debug("Address updated", extra={'account_id': account_id})
 
 def update_email(account_id, email):
-    db.collection('accounts').document(account_id).update({'email': email})
-    print("Email updated for account {0} to {1}.".format(account_id, email))
+    buffer_update(account_id, {'email': email})
+    logger.debug("Email updated", extra={'account_id': account_id})
 
 def update_ssn(account_id, ssn):
-    db.collection('accounts').document(account_id).update({'ssn': ssn})
-    print("SSN updated for account {0} to {1}.".format(account_id, ssn))
+    buffer_update(account_id, {'ssn': ssn})
+    logger.debug("SSN updated", extra={'account_id': account_id})
 
 def update_id(account_id, file_url):
-    db.collection('accounts').document(account_id).update({'id_': file_url})
-    print("ID document image updated for account {0} at url {1}".format(account_id, file_url))
+    buffer_update(account_id, {'id_': file_url})
+    logger.debug("ID document image updated", extra={'account_id': account_id})
 
-def update_id_fields(account_id, fields):
-    id_fields = {
+def _id_fields(fields):
+    return {
         'idNumber': fields.get('idNumber', ''),
         'name': fields.get('name', ''),
         'birthdate': fields.get('birthdate', ''),
@@ -61,12 +183,64 @@ def update_id_fields(account_id, fields):
         'pictureIsClear': fields.get('pictureIsClear', False),
         'idImageIsTampered': fields.get('idImageIsTampered', False)
     }
-    db.collection('accounts').document(account_id).update({'id_fields': id_fields})
-    print("ID fields updated for account {0}.".format(account_id))
 
-def update_adverse_media_check(account_id, has_adverse_media):
-    db.collection('accounts').document(account_id).update({'adverse_media_check': bool(has_adverse_media)})
-    print("Adverse media check updated for account {0} to {1}.".format(account_id, bool(has_adverse_media)))
+def update_id_fields(account_id, fields):
+    buffer_update(account_id, {'id_fields': _id_fields(fields)})
+    logger.debug("ID fields updated", extra={'account_id': account_id})
+
+def update_id_document(account_id, file_url, fields):
+    """Writes the ID image url and its extracted fields together in one write."""
+    buffer_update(account_id, {'id_': file_url, 'id_fields': _id_fields(fields)})
+    flush_account(account_id)
+    logger.info("ID document and fields updated", extra={'account_id': account_id})
+
+def update_adverse_media_check(account_id, has_adverse_media, details=None):
+    """
+    Records the check's outcome; None means it needs manual review. `details`
+    (verdict, confidence, summary, sources) is stored for review tooling.
+    """
+    if has_adverse_media is None:
+        status = 'pending_review'
+    else:
+        has_adverse_media = bool(has_adverse_media)
+        status = 'hit' if has_adverse_media else 'clear'
+    fields = {'adverse_media_check': has_adverse_media, 'adverse_media_status': status}
+    if details is not None:
+        fields['adverse_media_result'] = details
+    buffer_update(account_id, fields)
+    logger.info("Adverse media check updated", extra={'account_id': account_id, 'status': status})
+
+# Bot conversation state lives in its own collection, written through
+# immediately (not buffered) so every worker process sees it right away.
+def get_bot_state(kind):
+    return get_backend().get_bot_state(kind)
+
+def get_bot_state_entry(kind, key):
+    return get_backend().get_bot_state_entry(kind, key)
+
+def set_bot_state_entry(kind, key, value):
+    get_backend().set_bot_state_entry(kind, key, value)
+
+def delete_bot_state_entry(kind, key):
+    get_backend().delete_bot_state_entry(kind, key)
+
+def get_account(account_id):
+    """Flushes and returns an account's fields, or None if it does not exist."""
+    flush_account(account_id)
+    return get_backend().get_account(account_id)
+
+def get_accounts(account_ids):
+    """Like get_account for many accounts in one read; returns {account_id: fields or None}."""
+    account_ids = list(account_ids)
+    with _pending_lock:
+        buffered = {account_id: _pending_updates.pop(account_id) for account_id in account_ids if account_id in _pending_updates}
+    if buffered:
+        _commit(buffered)
+    return get_backend().get_accounts(account_ids)
+
+def list_files(prefix=''):
+    """Returns (file name, loader) pairs for stored files under `prefix`."""
+    return get_backend().list_files(prefix)
 
 
 # Tests:
@@ -74,4 +248,5 @@ def update_adverse_media_check(account_id, has_adverse_media):
 # update_name(account_id, 'Sayak')
 # update_address(account_id, 'Kolkata')
 # update_email(account_id, 'sayak@gmail.com')
-# update_ssn(account_id, '123456789')
\ No newline at end of file
+# update_ssn(account_id, '123456789')
+# flush_account(account_id)
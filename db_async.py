@@ -0,0 +1,85 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import db
+import metrics
+
+# The firebase_admin client is synchronous, so every call is handed to a
+# bounded thread pool. The semaphore caps how many of them can be in flight at
+# once so a slow backend backs up here instead of starving the event loop.
+MAX_INFLIGHT_WRITES = int(os.getenv('DB_MAX_INFLIGHT_WRITES', '8'))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_INFLIGHT_WRITES, thread_name_prefix='db')
+_inflight = asyncio.Semaphore(MAX_INFLIGHT_WRITES)
+
+async def _run(func, *args):
+    with metrics.timer('db', func.__name__):
+        async with _inflight:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_executor, functools.partial(func, *args))
+
+async def init():
+    return await _run(db.init)
+
+async def create_new_account():
+    return await _run(db.create_new_account)
+
+async def upload_file_to_storage(file_path, file_name):
+    return await _run(db.upload_file_to_storage, file_path, file_name)
+
+async def upload_bytes_to_storage(data, file_name, content_type=None):
+    return await _run(db.upload_bytes_to_storage, data, file_name, content_type)
+
+async def create_idv_results(account_id, idv_results):
+    return await _run(db.create_idv_results, account_id, idv_results)
+
+async def update_name(account_id, name):
+    return await _run(db.update_name, account_id, name)
+
+async def update_address(account_id, address):
+    return await _run(db.update_address, account_id, address)
+
+async def update_email(account_id, email):
+    return await _run(db.update_email, account_id, email)
+
+async def update_ssn(account_id, ssn):
+    return await _run(db.update_ssn, account_id, ssn)
+
+async def update_id(account_id, file_url):
+    return await _run(db.update_id, account_id, file_url)
+
+async def update_id_fields(account_id, fields):
+    return await _run(db.update_id_fields, account_id, fields)
+
+async def update_id_document(account_id, file_url, fields):
+    return await _run(db.update_id_document, account_id, file_url, fields)
+
+async def update_adverse_media_check(account_id, has_adverse_media, details=None):
+    return await _run(db.update_adverse_media_check, account_id, has_adverse_media, details)
+
+async def flush_account(account_id):
+    return await _run(db.flush_account, account_id)
+
+async def flush_all():
+    return await _run(db.flush_all)
+
+async def get_account(account_id):
+    return await _run(db.get_account, account_id)
+
+async def get_bot_state(kind):
+    return await _run(db.get_bot_state, kind)
+
+async def get_bot_state_entry(kind, key):
+    return await _run(db.get_bot_state_entry, kind, key)
+
+async def set_bot_state_entry(kind, key, value):
+    return await _run(db.set_bot_state_entry, kind, key, value)
+
+async def delete_bot_state_entry(kind, key):
+    return await _run(db.delete_bot_state_entry, kind, key)
+
+def shutdown():
+    """Write out anything still buffered, release Firebase and stop the worker threads."""
+    db.shutdown()
+    _executor.shutdown(wait=True)
@@ -0,0 +1,308 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import storage_upload
+
+# Every backend offers the same small set of operations, which is all db.py
+# needs to build accounts, uploads and bot state on top of:
+#
+#   new_account_id() -> str
+#   write_accounts({account_id: fields})       merge fields into each account
+#   get_account(account_id) -> dict | None
+#   get_accounts(account_ids) -> {account_id: dict | None}   one round trip
+#   upload_bytes(data, file_name, content_type) -> (url, uploaded)
+#   list_files(prefix) -> [(name, load)]       load() returns the content
+#   get_bot_state(kind) / get_bot_state_entry(kind, key)
+#   set_bot_state_entry(kind, key, value) / delete_bot_state_entry(kind, key)
+#   close()
+
+CREDENTIALS_PATH = os.getenv('FIREBASE_CREDENTIALS', './credentials.json')
+STORAGE_BUCKET = os.getenv('FIREBASE_STORAGE_BUCKET', 'fast-kyc.appspot.com')
+SQLITE_PATH = os.getenv('DB_SQLITE_PATH', 'kyc.sqlite3')
+FILES_DIR = os.getenv('DB_FILES_DIR', 'files')
+
+
+class FirestoreBackend:
+    """Accounts in Firestore, files in Cloud Storage."""
+
+    def __init__(self, client=None, bucket=None):
+        self._app = None
+        self.client = client
+        self.bucket = bucket
+        if client is None or bucket is None:
+            # firebase_admin is only imported when it is actually used.
+            import firebase_admin
+            from firebase_admin import credentials, firestore, storage
+            self._app = firebase_admin.initialize_app(credentials.Certificate(CREDENTIALS_PATH), {
+                'storageBucket': STORAGE_BUCKET
+            })
+            self.client = client or firestore.client(self._app)
+            self.bucket = bucket or storage.bucket(app=self._app)
+
+    def new_account_id(self):
+        # Generated client side, so creation rides along with the first write.
+        return self.client.collection('accounts').document().id
+
+    def write_accounts(self, updates):
+        batch = self.client.batch()
+        for account_id, fields in updates.items():
+            batch.set(self.client.collection('accounts').document(account_id), fields, merge=True)
+        batch.commit()
+
+    def get_account(self, account_id):
+        doc = self.client.collection('accounts').document(account_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def get_accounts(self, account_ids):
+        refs = [self.client.collection('accounts').document(account_id) for account_id in account_ids]
+        accounts = dict.fromkeys(account_ids)
+        for doc in self.client.get_all(refs):
+            if doc.exists:
+                accounts[doc.id] = doc.to_dict()
+        return accounts
+
+    def upload_bytes(self, data, file_name, content_type=None):
+        return storage_upload.upload_bytes(self.bucket, data, file_name, content_type)
+
+    def list_files(self, prefix=''):
+        return [(blob.name, blob.download_as_bytes) for blob in self.bucket.list_blobs(prefix=prefix)]
+
+    def _entries(self, kind):
+        return self.client.collection('bot_state').document(kind).collection('entries')
+
+    def get_bot_state(self, kind):
+        return {doc.id: doc.to_dict()['value'] for doc in self._entries(kind).stream()}
+
+    def get_bot_state_entry(self, kind, key):
+        doc = self._entries(kind).document(key).get()
+        return doc.to_dict()['value'] if doc.exists else None
+
+    def set_bot_state_entry(self, kind, key, value):
+        self._entries(kind).document(key).set({'value': value})
+
+    def delete_bot_state_entry(self, kind, key):
+        self._entries(kind).document(key).delete()
+
+    def close(self):
+        if self._app is not None:
+            import firebase_admin
+            firebase_admin.delete_app(self._app)
+            self._app = None
+
+
+class SQLiteBotState:
+    """
+    The bot_state table of a SQLite database, used by SQLiteBackend and by
+    persistence.SQLiteStateStore. Values are JSON; queries hold `lock`.
+    """
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS bot_state (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (kind, key)
+            )'''
+        )
+        self._conn.commit()
+
+    def load(self, kind):
+        with self._lock:
+            rows = self._conn.execute('SELECT key, value FROM bot_state WHERE kind = ?', (kind,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get(self, kind, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM bot_state WHERE kind = ? AND key = ?', (kind, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write_many(self, entries):
+        """Applies {(kind, key): value} in one transaction; None values delete."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO bot_state VALUES (?, ?, ?)',
+                [(kind, key, json.dumps(value)) for (kind, key), value in entries.items() if value is not None],
+            )
+            self._conn.executemany(
+                'DELETE FROM bot_state WHERE kind = ? AND key = ?',
+                [(kind, key) for (kind, key), value in entries.items() if value is None],
+            )
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class SQLiteBackend:
+    """Accounts and bot state in a local SQLite file, files in a local directory."""
+
+    def __init__(self, path=SQLITE_PATH, files_dir=FILES_DIR):
+        self._files_dir = files_dir
+        self._lock = threading.Lock()
+        # Called from the db worker threads and the flush timer, one at a time.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS accounts (
+                id TEXT PRIMARY KEY,
+                fields TEXT NOT NULL
+            )'''
+        )
+        self._conn.commit()
+        self._bot_state = SQLiteBotState(self._conn, self._lock)
+
+    def new_account_id(self):
+        return uuid.uuid4().hex
+
+    def write_accounts(self, updates):
+        with self._lock, self._conn:
+            for account_id, fields in updates.items():
+                row = self._conn.execute('SELECT fields FROM accounts WHERE id = ?', (account_id,)).fetchone()
+                merged = {**(json.loads(row[0]) if row else {}), **fields}
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO accounts VALUES (?, ?)', (account_id, json.dumps(merged))
+                )
+
+    def get_account(self, account_id):
+        with self._lock:
+            row = self._conn.execute('SELECT fields FROM accounts WHERE id = ?', (account_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_accounts(self, account_ids):
+        account_ids = list(account_ids)
+        accounts = dict.fromkeys(account_ids)
+        # Stay under SQLite's limit on bound parameters.
+        for start in range(0, len(account_ids), 500):
+            chunk = account_ids[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT id, fields FROM accounts WHERE id IN ({", ".join("?" * len(chunk))})', chunk
+                ).fetchall()
+            accounts.update((account_id, json.loads(fields)) for account_id, fields in rows)
+        return accounts
+
+    def _path(self, file_name):
+        return os.path.join(self._files_dir, file_name)
+
+    def upload_bytes(self, data, file_name, content_type=None):
+        path = self._path(file_name)
+        url = 'file://' + os.path.abspath(path)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return url, False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return url, True
+
+    def list_files(self, prefix=''):
+        files = []
+        for root, _, names in os.walk(self._files_dir):
+            for name in names:
+                file_name = os.path.relpath(os.path.join(root, name), self._files_dir)
+                if file_name.startswith(prefix) and not file_name.endswith('.tmp'):
+                    files.append((file_name, lambda path=self._path(file_name): _read(path)))
+        return sorted(files)
+
+    def get_bot_state(self, kind):
+        return self._bot_state.load(kind)
+
+    def get_bot_state_entry(self, kind, key):
+        return self._bot_state.get(kind, key)
+
+    def set_bot_state_entry(self, kind, key, value):
+        self._bot_state.write_many({(kind, key): value})
+
+    def delete_bot_state_entry(self, kind, key):
+        self._bot_state.write_many({(kind, key): None})
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryBackend:
+    """Everything in process memory; for tests, benchmarks and throwaway dev runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.accounts = {}
+        self.files = {}
+        self.bot_state = {}
+
+    def new_account_id(self):
+        return uuid.uuid4().hex
+
+    def write_accounts(self, updates):
+        with self._lock:
+            for account_id, fields in updates.items():
+                self.accounts.setdefault(account_id, {}).update(fields)
+
+    def get_account(self, account_id):
+        with self._lock:
+            fields = self.accounts.get(account_id)
+            return dict(fields) if fields is not None else None
+
+    def get_accounts(self, account_ids):
+        with self._lock:
+            return {
+                account_id: dict(self.accounts[account_id]) if account_id in self.accounts else None
+                for account_id in account_ids
+            }
+
+    def upload_bytes(self, data, file_name, content_type=None):
+        data = bytes(data)
+        with self._lock:
+            uploaded = self.files.get(file_name) != data
+            self.files[file_name] = data
+        return f'memory://{file_name}', uploaded
+
+    def list_files(self, prefix=''):
+        with self._lock:
+            names = sorted(name for name in self.files if name.startswith(prefix))
+        return [(name, lambda name=name: self.files[name]) for name in names]
+
+    def get_bot_state(self, kind):
+        with self._lock:
+            return dict(self.bot_state.get(kind, {}))
+
+    def get_bot_state_entry(self, kind, key):
+        with self._lock:
+            return self.bot_state.get(kind, {}).get(key)
+
+    def set_bot_state_entry(self, kind, key, value):
+        with self._lock:
+            self.bot_state.setdefault(kind, {})[key] = value
+
+    def delete_bot_state_entry(self, kind, key):
+        with self._lock:
+            self.bot_state.get(kind, {}).pop(key, None)
+
+    def close(self):
+        pass
+
+
+def make_backend(name=None):
+    """
+    Builds the backend named by `name` or DB_BACKEND: "firestore" (default),
+    "sqlite" (DB_SQLITE_PATH, files under DB_FILES_DIR) or "memory".
+    """
+    name = name or os.getenv('DB_BACKEND', 'firestore')
+    if name == 'firestore':
+        return FirestoreBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'memory':
+        return MemoryBackend()
+    raise ValueError(f'Unknown DB_BACKEND: {name}')
@@ -0,0 +1,149 @@
+import os
+import re
+import asyncio
+import logging
+import aiohttp
+from ttl_cache import TTLCache
+import metrics
+from http_client import get_session
+
+logger = logging.getLogger(__name__)
+
+ABSTRACT_API_URL = "https://emailvalidation.abstractapi.com/v1/"
+ABSTRACT_API_TIMEOUT_SECONDS = float(os.getenv("ABSTRACT_API_TIMEOUT_SECONDS", "10"))
+
+# Verdicts returned by validate_email
+VALID = "valid"
+INVALID = "invalid"
+UNDELIVERABLE = "undeliverable"
+DISPOSABLE = "disposable"
+ERROR = "error"
+
+EMAIL_CACHE_SIZE = int(os.getenv("EMAIL_CACHE_SIZE", "10000"))
+EMAIL_CACHE_TTL_SECONDS = float(os.getenv("EMAIL_CACHE_TTL_SECONDS", "86400"))
+DOMAIN_CACHE_SIZE = int(os.getenv("EMAIL_DOMAIN_CACHE_SIZE", "5000"))
+DOMAIN_CACHE_TTL_SECONDS = float(os.getenv("EMAIL_DOMAIN_CACHE_TTL_SECONDS", "604800"))
+
+email_pattern = re.compile(r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+$")
+
+# Well known throwaway providers. Extend with DISPOSABLE_DOMAINS_FILE, one
+# domain per line.
+DISPOSABLE_DOMAINS = {
+    "10minutemail.com",
+    "discard.email",
+    "dispostable.com",
+    "fakeinbox.com",
+    "getairmail.com",
+    "getnada.com",
+    "guerrillamail.com",
+    "guerrillamail.net",
+    "maildrop.cc",
+    "mailinator.com",
+    "mailnesia.com",
+    "mintemail.com",
+    "mohmal.com",
+    "sharklasers.com",
+    "spamgourmet.com",
+    "temp-mail.org",
+    "tempmail.com",
+    "tempmailo.com",
+    "throwawaymail.com",
+    "trashmail.com",
+    "yopmail.com",
+}
+
+_disposable_file = os.getenv("DISPOSABLE_DOMAINS_FILE")
+if _disposable_file:
+    with open(_disposable_file) as f:
+        DISPOSABLE_DOMAINS.update(line.strip().lower() for line in f if line.strip())
+
+_email_cache = TTLCache(EMAIL_CACHE_SIZE, EMAIL_CACHE_TTL_SECONDS)
+_domain_cache = TTLCache(DOMAIN_CACHE_SIZE, DOMAIN_CACHE_TTL_SECONDS)
+
+
+def normalize_email(address):
+    return address.strip().lower()
+
+
+def precheck_email(address):
+    """
+    Rejects obviously bad addresses without a network call.
+
+    Returns a verdict, or None if the address needs a full check.
+    """
+    if len(address) > 254 or not email_pattern.match(address):
+        return INVALID
+    domain = address.rsplit("@", 1)[1]
+    if domain in DISPOSABLE_DOMAINS:
+        return DISPOSABLE
+    domain_verdict = _domain_cache.get(domain)
+    if domain_verdict is not None and domain_verdict != VALID:
+        return domain_verdict
+    return None
+
+
+def _verdict_from_response(email_data):
+    if (
+        not email_data["is_valid_format"]["value"]
+        or not email_data["is_mx_found"]["value"]
+        or not email_data["is_smtp_valid"]["value"]
+    ):
+        return INVALID
+    if email_data["deliverability"] == "UNDELIVERABLE":
+        return UNDELIVERABLE
+    if email_data["is_disposable_email"]["value"]:
+        return DISPOSABLE
+    return VALID
+
+
+def _domain_verdict_from_response(email_data):
+    # Only facts about the domain itself are safe to reuse for other mailboxes.
+    if email_data["is_disposable_email"]["value"]:
+        return DISPOSABLE
+    if not email_data["is_mx_found"]["value"]:
+        return INVALID
+    return VALID
+
+
+async def validate_email(address):
+    """
+    Validates an email address, consulting the local checks and caches before
+    calling AbstractAPI.
+
+    Args:
+    - address (str): The email address as typed by the user.
+
+    Returns:
+    - str: One of VALID, INVALID, UNDELIVERABLE, DISPOSABLE or ERROR.
+    """
+    address = normalize_email(address)
+    verdict = precheck_email(address)
+    if verdict is not None:
+        return verdict
+
+    verdict = _email_cache.get(address)
+    if verdict is not None:
+        return verdict
+
+    api_key = os.getenv("ABSTRACT_API_KEY")
+    try:
+        with metrics.timer("outbound", "abstractapi"):
+            async with get_session().get(
+                ABSTRACT_API_URL,
+                params={"api_key": api_key, "email": address},
+                timeout=aiohttp.ClientTimeout(total=ABSTRACT_API_TIMEOUT_SECONDS),
+            ) as response:
+                if response.status != 200:
+                    return ERROR
+                email_data = await response.json()
+        verdict = _verdict_from_response(email_data)
+        domain_verdict = _domain_verdict_from_response(email_data)
+    # ClientError includes ContentTypeError for a non-JSON body; ValueError,
+    # KeyError and TypeError cover malformed JSON.
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Email validation request failed: %s", type(e).__name__)
+        return ERROR
+
+    _email_cache.set(address, verdict)
+    _domain_cache.set(address.rsplit("@", 1)[1], domain_verdict)
+    return verdict
@@ -0,0 +1,144 @@
+import io
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only exact matches hit
+    Image = None
+
+CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "extraction_cache.sqlite3")
+MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+# Largest Hamming distance between perceptual hashes that still counts as the
+# same photo. The hash is 256 bits; 0 (the default) disables near-duplicate
+# matching. Different cards can be only a few bits apart, so near-duplicates
+# are only ever reused within the same account.
+PHASH_MAX_DISTANCE = int(os.getenv("EXTRACTION_CACHE_PHASH_DISTANCE", "0"))
+PHASH_SIZE = 16
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute(
+            """CREATE TABLE IF NOT EXISTS extractions (
+                content_hash TEXT PRIMARY KEY,
+                phash TEXT,
+                card_json TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                account_id TEXT,
+                version TEXT
+            )"""
+        )
+        columns = [row[1] for row in _conn.execute("PRAGMA table_info(extractions)")]
+        for column in ("account_id", "version"):
+            if column not in columns:
+                _conn.execute(f"ALTER TABLE extractions ADD COLUMN {column} TEXT")
+        _conn.execute(
+            "CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)"
+        )
+        _conn.commit()
+    return _conn
+
+
+def _perceptual_hash(image_bytes):
+    """Difference hash of the image as a hex string, or None without Pillow."""
+    if Image is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert("L")
+    except OSError:
+        return None
+    image = image.resize((PHASH_SIZE + 1, PHASH_SIZE), Image.LANCZOS)
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(PHASH_SIZE):
+        for col in range(PHASH_SIZE):
+            left = pixels[row * (PHASH_SIZE + 1) + col]
+            right = pixels[row * (PHASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return format(bits, f"0{PHASH_SIZE * PHASH_SIZE // 4}x")
+
+
+def hash_image(image_bytes, version=""):
+    """
+    Computes the cache keys for an image.
+
+    Args:
+    - image_bytes (bytes): The photo.
+    - version (str): Identifies the extractor (model, prompt, schema), so a
+      change to it does not serve results in the old shape.
+
+    Returns:
+    - tuple: (content_hash, phash). phash is None when Pillow is unavailable
+      or near-duplicate matching is off, since decoding the image is costly.
+    """
+    digest = hashlib.sha256(version.encode())
+    digest.update(image_bytes)
+    phash = _perceptual_hash(image_bytes) if PHASH_MAX_DISTANCE > 0 else None
+    return digest.hexdigest(), phash
+
+
+def lookup(content_hash, phash=None, account_id=None, version=""):
+    """
+    Returns the cached card_parsed dict for an image, or None.
+
+    Tries the exact content hash first, then the closest perceptual hash within
+    PHASH_MAX_DISTANCE among photos cached for the same account and extractor
+    version.
+    """
+    with _lock:
+        conn = _connection()
+        row = conn.execute(
+            "SELECT content_hash, card_json FROM extractions WHERE content_hash = ?",
+            (content_hash,),
+        ).fetchone()
+        if row is None and phash is not None and account_id is not None and PHASH_MAX_DISTANCE > 0:
+            target = int(phash, 16)
+            best = None
+            for key, other, card_json in conn.execute(
+                "SELECT content_hash, phash, card_json FROM extractions"
+                " WHERE phash IS NOT NULL AND account_id = ? AND version = ?",
+                (account_id, version),
+            ):
+                distance = bin(target ^ int(other, 16)).count("1")
+                if distance <= PHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+                    best = (distance, key, card_json)
+            if best is not None:
+                row = best[1:]
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE extractions SET last_used = ? WHERE content_hash = ?",
+            (time.time(), row[0]),
+        )
+        conn.commit()
+    return json.loads(row[1])
+
+
+def store(content_hash, phash, card_parsed, account_id=None, version=""):
+    """Caches card_parsed for an image, evicting the least recently used entries."""
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, phash, json.dumps(card_parsed), now, now, account_id, version),
+        )
+        conn.execute(
+            """DELETE FROM extractions WHERE content_hash IN (
+                SELECT content_hash FROM extractions
+                ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""",
+            (MAX_ENTRIES,),
+        )
+        conn.commit()
@@ -0,0 +1,38 @@
+import os
+import aiohttp
+
+# One pooled session is shared by every outbound call so connections to
+# api.openai.com and the browse agent are kept alive and reused.
+LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "20"))
+KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+DNS_CACHE_SECONDS = int(os.getenv("HTTP_DNS_CACHE_SECONDS", "300"))
+
+_session = None
+
+
+async def open_session():
+    """Create the application-wide session. Call once at startup."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_SECONDS,
+            ttl_dns_cache=DNS_CACHE_SECONDS,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+def get_session():
+    """Return the shared session opened by open_session()."""
+    if _session is None or _session.closed:
+        raise RuntimeError("HTTP session is not open; call open_session() first.")
+    return _session
+
+
+async def close_session():
+    """Close the shared session and its pooled connections."""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import logging
+import time
+import asyncio
+import dataclasses
+from dataclasses import dataclass
+import requests
+from dotenv import load_dotenv
+from helpers import encode_image_bytes
+from http_client import get_session
+from image_preprocessing import preprocess_image
+from streaming_body import Base64JsonBody, PLACEHOLDER
+import metrics
+from rate_limit import openai_limiter, retry_after_seconds
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Point OPENAI_BASE_URL at openai_stub.py to run without the real API.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+CHAT_COMPLETIONS_URL = f"{OPENAI_BASE_URL}/chat/completions"
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("OPENAI_MAX_RATE_LIMIT_RETRIES", "5"))
+
+
+class ExtractionError(Exception):
+    """Raised when the model's response cannot be turned into a result."""
+
+
+@dataclass
+class IdFields:
+    idNumber: str = ""
+    name: str = ""
+    birthdate: str = ""
+    sex: str = ""
+    address: str = ""
+    electronicReplicaOfID: bool = False
+    paperReplicaOfID: bool = False
+    pictureIsClear: bool = False
+    idImageIsTampered: bool = False
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a result from the model's JSON, checking each field's type."""
+        if not isinstance(data, dict):
+            raise ExtractionError(f"Expected a JSON object, got {type(data).__name__}")
+        values = {}
+        for field in dataclasses.fields(cls):
+            value = data.get(field.name)
+            if value is None:
+                continue
+            # Models sometimes return a numeric idNumber; keep it as text.
+            if field.type is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+            if not isinstance(value, field.type):
+                raise ExtractionError(
+                    f"{field.name} should be {field.type.__name__}, got {type(value).__name__}"
+                )
+            values[field.name] = value
+        return cls(**values)
+
+    def to_dict(self):
+        return dataclasses.asdict(self)
+
+
+_type_names = {str: "string", bool: "boolean", int: "integer", float: "number"}
+
+
+class IdExtractor:
+    """
+    Extracts structured fields from an ID photo with a vision model.
+
+    The prompt is built once from the schema's fields, and requests go through
+    pooled connections: the shared aiohttp session for extract() and a
+    requests.Session for extract_sync().
+
+    Args:
+    - schema (type): A dataclass with a from_dict classmethod, e.g. IdFields.
+    - model (str): The model to use for the API call. Default is "gpt-4o".
+    - max_tokens (int): The maximum number of tokens for the response.
+    - limiter (RateLimiter): Shared request/token budget for async calls.
+    """
+
+    def __init__(self, schema=IdFields, model="gpt-4o", max_tokens=300, limiter=openai_limiter):
+        self.schema = schema
+        self.limiter = limiter
+        self.model = model
+        self.max_tokens = max_tokens
+        fields = "\n".join(
+            f"{field.name} ({_type_names[field.type]})"
+            for field in dataclasses.fields(schema)
+        )
+        self._prompt = {
+            "type": "text",
+            "text": f"Please process this image and output the following in JSON:\n\n{fields}\n",
+        }
+        self._sync_session = None
+        # Changes whenever the request would; keys cached extractions.
+        self.version = hashlib.sha256(
+            json.dumps([model, max_tokens, self._prompt, schema.__name__]).encode()
+        ).hexdigest()[:16]
+
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
+            "Content-Type": "application/json",
+        }
+
+    def build_payload(self, image_bytes):
+        """The request as a dict, with the image inlined (for Batch API files)."""
+        return self._payload(encode_image_bytes(preprocess_image(image_bytes)))
+
+    def build_body(self, image_bytes):
+        """The request as a streaming body that base64-encodes the image as it is sent."""
+        return Base64JsonBody(self._payload(PLACEHOLDER), preprocess_image(image_bytes))
+
+    def _payload(self, encoded_img):
+        return {
+            "model": self.model,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        self._prompt,
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": f"data:image/jpeg;base64,{encoded_img}"},
+                        },
+                    ],
+                }
+            ],
+            "max_tokens": self.max_tokens,
+        }
+
+    def parse_response(self, result):
+        """Validates a chat-completions response into a schema instance."""
+        try:
+            content_string = result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            # Only the shape: the body can hold the applicant's details.
+            shape = sorted(result) if isinstance(result, dict) else type(result).__name__
+            raise ExtractionError(f"Unexpected response with {shape}")
+        try:
+            content = json.loads(content_string)
+        except json.JSONDecodeError as e:
+            raise ExtractionError(f"Response content is not JSON: {e}")
+        return self.schema.from_dict(content)
+
+    @metrics.timed("outbound", "openai_extract")
+    async def extract(self, image_bytes):
+        """
+        Extracts the schema's fields from a photo.
+
+        Args:
+        - image_bytes (bytes): The photo.
+
+        Returns:
+        - The schema instance, IdFields by default.
+        """
+        # Preprocessing is CPU bound; keep it off the loop. The base64 is
+        # encoded chunk by chunk while the body is written.
+        body = await asyncio.to_thread(self.build_body, image_bytes)
+        headers = {**self._headers(), "Content-Length": str(len(body))}
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            # Requests queue here instead of failing when the quota is spent.
+            reservation = await self.limiter.acquire()
+            started = time.perf_counter()
+            async with get_session().post(
+                CHAT_COMPLETIONS_URL, headers=headers, data=body
+            ) as response:
+                if response.status == 429 and attempt < MAX_RATE_LIMIT_RETRIES:
+                    metrics.outcomes.inc(outcome="openai_rate_limited")
+                    self.limiter.pause(retry_after_seconds(response.headers))
+                    continue
+                result = await response.json()
+            break
+        self.limiter.record_usage(reservation, result.get("usage", {}).get("total_tokens"))
+        logger.info(
+            "ID extraction finished",
+            extra={
+                "duration_ms": round((time.perf_counter() - started) * 1000),
+                "image_bytes": len(image_bytes),
+                "request_bytes": len(body),
+            },
+        )
+        return self.parse_response(result)
+
+    def extract_sync(self, image_bytes):
+        """Blocking version of extract() for scripts and batch tools."""
+        if self._sync_session is None:
+            self._sync_session = requests.Session()
+        body = self.build_body(image_bytes)
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            started = time.perf_counter()
+            response = self._sync_session.post(
+                CHAT_COMPLETIONS_URL, headers=self._headers(), data=body
+            )
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                break
+            time.sleep(retry_after_seconds(response.headers))
+        logger.info(
+            "ID extraction finished",
+            extra={
+                "duration_ms": round((time.perf_counter() - started) * 1000),
+                "image_bytes": len(image_bytes),
+                "request_bytes": len(body),
+            },
+        )
+        return self.parse_response(response.json())
+
+
+default_extractor = IdExtractor()
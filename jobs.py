@@ -0,0 +1,167 @@
+import os
+import time
+import logging
+import random
+import asyncio
+from collections import deque
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("JOBS_DRAIN_TIMEOUT_SECONDS", "30"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("JOBS_RETRY_BASE_DELAY_SECONDS", "1.0"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("JOBS_RETRY_MAX_DELAY_SECONDS", "30.0"))
+LATENCY_WINDOW = 1000
+
+
+def _setting(name, key, default):
+    return int(os.getenv(f"JOBS_{name.upper()}_{key}", str(default)))
+
+
+class JobQueue:
+    """
+    A bounded queue of background jobs of one type, served by a fixed pool of
+    worker tasks.
+
+    submit() waits while the queue is full, so producers slow down instead of
+    piling up unbounded work. Failed jobs are retried with jittered
+    exponential backoff.
+    """
+
+    def __init__(self, name, handler, concurrency, max_size, max_retries):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._workers = []
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._retried = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        for i in range(self.concurrency):
+            self._workers.append(
+                asyncio.create_task(self._work(), name=f"{self.name}-worker-{i}")
+            )
+
+    async def submit(self, *args):
+        await self._queue.put((time.monotonic(), args))
+
+    async def _work(self):
+        while True:
+            enqueued_at, args = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._run(args)
+                self._completed += 1
+                job_results.inc(queue=self.name, result="completed")
+            except Exception:
+                self._failed += 1
+                job_results.inc(queue=self.name, result="failed")
+                logger.exception("Job failed", extra={"queue": self.name})
+            finally:
+                self._in_flight -= 1
+                latency = time.monotonic() - enqueued_at
+                self._latencies.append(latency)
+                job_latency.observe(latency, queue=self.name)
+                self._queue.task_done()
+
+    async def _run(self, args):
+        attempt = 0
+        while True:
+            try:
+                return await self.handler(*args)
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(RETRY_BASE_DELAY_SECONDS * 2 ** attempt, RETRY_MAX_DELAY_SECONDS)
+                attempt += 1
+                self._retried += 1
+                # Full jitter keeps retries from a burst of failures apart.
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def drain(self, timeout):
+        """Waits for queued jobs to finish, then stops the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Job queue did not drain", extra={"queue": self.name, "dropped": self._queue.qsize()})
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+        return {
+            "depth": self._queue.qsize(),
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "retried": self._retried,
+            "latency_p50_seconds": percentile(0.5),
+            "latency_p95_seconds": percentile(0.95),
+        }
+
+
+queues = {}
+
+queue_depth = metrics.Gauge("kyc_job_queue_depth", "Jobs waiting per queue.", ("queue",))
+jobs_in_flight = metrics.Gauge("kyc_jobs_in_flight", "Jobs running per queue.", ("queue",))
+job_latency = metrics.Histogram(
+    "kyc_job_latency_seconds", "Time from submit to completion per queue.", ("queue",)
+)
+job_results = metrics.Counter("kyc_jobs_total", "Finished jobs per queue and result.", ("queue", "result"))
+
+
+def _collect():
+    for name, queue in queues.items():
+        queue_depth.set(queue._queue.qsize(), queue=name)
+        jobs_in_flight.set(queue._in_flight, queue=name)
+
+
+metrics.register_collector(_collect)
+
+
+def register(name, handler, concurrency=4, max_size=100, max_retries=2):
+    """
+    Registers and starts a queue for one job type. Defaults can be overridden
+    with JOBS_<NAME>_CONCURRENCY, JOBS_<NAME>_QUEUE_SIZE and
+    JOBS_<NAME>_RETRIES.
+    """
+    queue = JobQueue(
+        name,
+        handler,
+        concurrency=_setting(name, "CONCURRENCY", concurrency),
+        max_size=_setting(name, "QUEUE_SIZE", max_size),
+        max_retries=_setting(name, "RETRIES", max_retries),
+    )
+    queue.start()
+    queues[name] = queue
+    return queue
+
+
+async def submit(name, *args):
+    await queues[name].submit(*args)
+
+
+async def drain_all(timeout=DRAIN_TIMEOUT_SECONDS):
+    # Drain in registration order, since earlier job types may still submit
+    # follow-up work to later ones.
+    for name, queue in queues.items():
+        await queue.drain(timeout)
+        logger.info("Job queue drained", extra={"queue": name, **queue.stats()})
+    queues.clear()
+
+
+def stats():
+    return {name: queue.stats() for name, queue in queues.items()}
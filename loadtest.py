@@ -0,0 +1,509 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+
+# Offline end-to-end benchmark. Drives the real ConversationHandler with
+# synthetic Telegram updates, against in-process fakes for the Bot API,
+# Firestore, Storage, chat completions (replaying rando.json), AbstractAPI and
+# the browse agent. Each fake has configurable latency and error injection.
+#
+#   python3 loadtest.py --applicants 500 --concurrency 50 --openai-latency-ms 1500
+#
+# Reports applicants/sec and p50/p95/p99 for every instrumented stage.
+
+
+class InjectedError(Exception):
+    """Raised by a fake backend to simulate a failure."""
+
+
+class FaultInjector:
+    def __init__(self, latency_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+
+    def sync(self, operation):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if random.random() < self.error_rate:
+            raise InjectedError(f"Injected {operation} failure")
+
+    async def wait(self):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return random.random() < self.error_rate
+
+
+# Firestore
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+
+class FakeDocument:
+    def __init__(self, firestore, path):
+        self._firestore = firestore
+        self._path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._firestore, self._path + (name,))
+
+    def _write(self, fields, merge):
+        with self._firestore.lock:
+            docs = self._firestore.documents
+            docs[self._path] = {**docs.get(self._path, {}), **fields} if merge else dict(fields)
+
+    def set(self, fields, merge=False):
+        self._firestore.faults.sync("set")
+        self._write(fields, merge)
+
+    def update(self, fields):
+        self._firestore.faults.sync("update")
+        if self._path not in self._firestore.documents:
+            raise KeyError(f"No document to update: {'/'.join(self._path)}")
+        self._write(fields, merge=True)
+
+    def get(self):
+        self._firestore.faults.sync("get")
+        return FakeSnapshot(self.id, self._firestore.documents.get(self._path))
+
+    def delete(self):
+        self._firestore.faults.sync("delete")
+        with self._firestore.lock:
+            self._firestore.documents.pop(self._path, None)
+
+
+class FakeCollection:
+    def __init__(self, firestore, path):
+        self._firestore = firestore
+        self._path = path
+
+    def document(self, doc_id=None):
+        doc_id = doc_id or "".join(random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=20))
+        return FakeDocument(self._firestore, self._path + (doc_id,))
+
+    def add(self, fields):
+        doc = self.document()
+        doc.set(fields)
+        return time.time(), doc
+
+    def stream(self):
+        self._firestore.faults.sync("stream")
+        with self._firestore.lock:
+            items = list(self._firestore.documents.items())
+        depth = len(self._path) + 1
+        return [
+            FakeSnapshot(path[-1], data)
+            for path, data in items
+            if len(path) == depth and path[:-1] == self._path
+        ]
+
+
+class FakeBatch:
+    def __init__(self, firestore):
+        self._firestore = firestore
+        self._writes = []
+
+    def set(self, doc, fields, merge=False):
+        self._writes.append((doc, fields, merge))
+
+    def update(self, doc, fields):
+        self._writes.append((doc, fields, True))
+
+    def commit(self):
+        self._firestore.faults.sync("commit")
+        for doc, fields, merge in self._writes:
+            doc._write(fields, merge)
+
+
+class FakeFirestore:
+    """Just enough of firestore.Client for db.py, kept in a dict."""
+
+    def __init__(self, faults):
+        self.faults = faults
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        self.faults.sync("get")
+        return [FakeSnapshot(ref.id, self.documents.get(ref._path)) for ref in refs]
+
+
+# Storage
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self._bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.metadata = None
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self._bucket.name}/{self.name}"
+
+    def upload_from_file(self, file, size=None, content_type=None, if_generation_match=None, **kwargs):
+        self._bucket.faults.sync("upload")
+        if if_generation_match == 0 and self.name in self._bucket.objects:
+            error = InjectedError("Precondition failed")
+            error.code = 412
+            raise error
+        self._bucket.objects[self.name] = (file.read(), content_type, self.metadata)
+
+    def download_as_bytes(self):
+        self._bucket.faults.sync("download")
+        return self._bucket.objects[self.name][0]
+
+
+class FakeBucket:
+    """Just enough of storage.Bucket for db.py, kept in a dict."""
+
+    name = "fast-kyc.appspot.com"
+
+    def __init__(self, faults):
+        self.faults = faults
+        self.objects = {}
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size)
+
+    def get_blob(self, name):
+        self.faults.sync("get_blob")
+        if name not in self.objects:
+            return None
+        blob = FakeBlob(self, name)
+        blob.metadata = self.objects[name][2]
+        return blob
+
+    def list_blobs(self, prefix=""):
+        return [FakeBlob(self, name) for name in self.objects if name.startswith(prefix)]
+
+
+# Telegram
+
+
+def make_fake_telegram_request(image_bytes, faults):
+    from telegram.request import BaseRequest
+
+    class FakeTelegramRequest(BaseRequest):
+        """Answers Bot API calls locally instead of talking to Telegram."""
+
+        def __init__(self):
+            self.calls = defaultdict(int)
+            self._message_id = 0
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, **timeouts):
+            if "/file/bot" in url:
+                return 200, image_bytes
+            endpoint = url.rsplit("/", 1)[1]
+            self.calls[endpoint] += 1
+            parameters = request_data.parameters if request_data else {}
+            # getMe runs once at startup; failing it would abort the whole run.
+            if await faults.wait() and endpoint != "getMe":
+                body = {"ok": False, "error_code": 502, "description": "Injected Bot API failure"}
+                return 502, json.dumps(body).encode()
+            if endpoint == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "KYC", "username": "fast_kyc_bot"}
+            elif endpoint == "getFile":
+                file_id = parameters["file_id"]
+                result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(image_bytes), "file_path": f"photos/{file_id}.jpg"}
+            elif endpoint == "sendMessage":
+                self._message_id += 1
+                result = {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": int(parameters["chat_id"]), "type": "private"},
+                    "text": parameters.get("text", ""),
+                }
+            else:
+                result = True
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    return FakeTelegramRequest()
+
+
+class Applicant:
+    """Builds the updates one synthetic applicant sends."""
+
+    _update_ids = iter(range(1, 10 ** 9))
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._message_ids = iter(range(1, 10 ** 6))
+
+    def _message(self, **fields):
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": self.user_id, "type": "private"},
+                "from": {"id": self.user_id, "is_bot": False, "first_name": "Applicant"},
+                **fields,
+            },
+        }
+
+    def start(self):
+        return self._message(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+
+    def photo(self):
+        file_id = f"photo-{self.user_id}"
+        return self._message(photo=[{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 800}])
+
+    def text(self, text):
+        return self._message(text=text)
+
+
+# Fake HTTP services (chat completions, AbstractAPI, browse agent)
+
+
+def make_services_app(args):
+    from aiohttp import web
+    import openai_stub
+
+    abstract_faults = FaultInjector(args.abstract_latency_ms, args.abstract_error_rate)
+    agent_faults = FaultInjector(args.agent_latency_ms, args.agent_error_rate)
+
+    async def abstract(request):
+        if await abstract_faults.wait():
+            return web.json_response({"error": "injected"}, status=500)
+        return web.json_response({
+            "email": request.query.get("email"),
+            "deliverability": "DELIVERABLE",
+            "is_valid_format": {"value": True},
+            "is_mx_found": {"value": True},
+            "is_smtp_valid": {"value": True},
+            "is_disposable_email": {"value": False},
+        })
+
+    async def browse(request):
+        await request.read()
+        if await agent_faults.wait():
+            return web.json_response({"error": "injected"}, status=500)
+        return web.json_response({
+            "objectiveComplete": {
+                "result": "No",
+                "verdict": "No",
+                "confidence": 0.9,
+                "summary": "No adverse media found.",
+                "sources": [],
+            }
+        })
+
+    app = web.Application()
+    app.router.add_get("/abstract/v1/", abstract)
+    app.router.add_post("/browse", browse)
+    app.add_subapp("/openai", openai_stub.make_app(args.response, args.openai_latency_ms, args.openai_error_rate))
+    return app
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000
+
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+async def run(args):
+    from aiohttp import web
+    import bot
+    import db
+    import db_backends
+    import storage_upload
+    import jobs
+    import metrics
+    import browse_agent
+    import email_validation
+    import id_extraction
+
+    if args.db_backend == "fake-firestore":
+        # The fake bucket ignores retry policies; building the real one would
+        # need google-cloud-storage installed.
+        storage_upload.upload_retry = lambda: None
+        db.init(
+            client=FakeFirestore(FaultInjector(args.firestore_latency_ms, args.firestore_error_rate)),
+            bucket=FakeBucket(FaultInjector(args.storage_latency_ms, args.storage_error_rate)),
+        )
+    else:
+        db.init(backend=db_backends.make_backend(args.db_backend))
+    # Keep raw samples next to the histograms for exact percentiles.
+    samples = defaultdict(list)
+    observe = metrics.stage_duration.observe
+
+    def record(value, **labels):
+        samples[f"{labels['stage']}.{labels['op']}"].append(value)
+        observe(value, **labels)
+
+    metrics.stage_duration.observe = record
+
+    runner = web.AppRunner(make_services_app(args), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    id_extraction.CHAT_COMPLETIONS_URL = f"{base_url}/openai/v1/chat/completions"
+    email_validation.ABSTRACT_API_URL = f"{base_url}/abstract/v1/"
+    browse_agent.BROWSE_AGENT_URL = f"{base_url}/browse"
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    telegram_request = make_fake_telegram_request(
+        image_bytes, FaultInjector(args.telegram_latency_ms, args.telegram_error_rate)
+    )
+    application, _ = bot.build_application("123456:LOADTEST", request=telegram_request)
+
+    failures = defaultdict(int)
+    # process_update() hands handler exceptions to the error handlers rather
+    # than raising them, so failures are collected here per applicant.
+    handler_errors = {}
+
+    async def record_error(update, context):
+        if update is not None and update.effective_user is not None:
+            handler_errors[update.effective_user.id] = type(context.error).__name__
+
+    application.add_error_handler(record_error)
+
+    async def onboard(applicant, semaphore):
+        async with semaphore:
+            started = time.perf_counter()
+            for update_data in (
+                applicant.start(),
+                applicant.photo(),
+                applicant.text(f"applicant{applicant.user_id}@example.com"),
+                applicant.text("123-45-6789"),
+            ):
+                update = bot.Update.de_json(update_data, application.bot)
+                try:
+                    await application.process_update(update)
+                except Exception as e:
+                    handler_errors[applicant.user_id] = type(e).__name__
+                if applicant.user_id in handler_errors:
+                    failures[handler_errors[applicant.user_id]] += 1
+                    return
+            samples["applicant.conversation"].append(time.perf_counter() - started)
+
+    async with application:
+        await application.post_init(application)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        applicants = [Applicant(100000 + i) for i in range(args.applicants)]
+        started = time.perf_counter()
+        await asyncio.gather(*(onboard(applicant, semaphore) for applicant in applicants))
+        conversations_done = time.perf_counter() - started
+        # Background ID processing and screening are part of the funnel too.
+        while any(q.stats()["depth"] or q.stats()["in_flight"] for q in jobs.queues.values()):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        job_stats = jobs.stats()
+        await application.post_shutdown(application)
+    db.shutdown()
+    await runner.cleanup()
+
+    return {
+        "applicants": args.applicants,
+        "concurrency": args.concurrency,
+        "completed_conversations": args.applicants - sum(failures.values()),
+        "failed_conversations": dict(failures),
+        "conversations_seconds": round(conversations_done, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        # Only applicants who got through the whole conversation count.
+        "applicants_per_second": round((args.applicants - sum(failures.values())) / elapsed, 2),
+        "jobs": job_stats,
+        "bot_api_calls": dict(telegram_request.calls),
+        "stages": {stage: percentiles(values) for stage, values in sorted(samples.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the onboarding bot.")
+    parser.add_argument("--applicants", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--image", default="7407996533_id_document.jpg")
+    parser.add_argument("--response", default="rando.json", help="Chat completion to replay.")
+    for name, latency in (
+        ("openai", 1500), ("agent", 3000), ("abstract", 200),
+        ("firestore", 20), ("storage", 100), ("telegram", 30),
+    ):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--db-backend", default="fake-firestore", choices=("fake-firestore", "memory", "sqlite"),
+        help="memory or sqlite measure the bot without backend latency (the --firestore/--storage flags then do nothing).",
+    )
+    parser.add_argument("--with-caches", action="store_true", help="Keep the extraction and screening caches on.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    # Configure the bot's modules before they are imported.
+    state_dir = tempfile.mkdtemp(prefix="kyc-loadtest-")
+    for key in ("OPENAI_API_KEY", "ABSTRACT_API_KEY", "HDR_API_KEY"):
+        os.environ.setdefault(key, "loadtest")
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["LOG_LEVEL"] = os.getenv("LOG_LEVEL", "WARNING")
+    os.environ["EXTRACTION_CACHE_PATH"] = os.path.join(state_dir, "extraction_cache.sqlite3")
+    os.environ["SCREENING_CACHE_PATH"] = os.path.join(state_dir, "screening_cache.sqlite3")
+    os.environ["DB_SQLITE_PATH"] = os.path.join(state_dir, "kyc.sqlite3")
+    os.environ["DB_FILES_DIR"] = os.path.join(state_dir, "files")
+    if not args.with_caches:
+        # Every applicant sends the same photo and name, so caching would
+        # measure cache hits instead of the pipeline.
+        os.environ["EXTRACTION_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["SCREENING_CACHE_TTL_SECONDS"] = "0"
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"{report['completed_conversations']}/{report['applicants']} applicants completed at concurrency {report['concurrency']}: "
+        f"{report['applicants_per_second']} applicants/sec "
+        f"({report['elapsed_seconds']}s, conversations done in {report['conversations_seconds']}s)"
+    )
+    if report["failed_conversations"]:
+        print(f"Failed conversations: {report['failed_conversations']}")
+    for name, stats in report["jobs"].items():
+        print(f"Job {name}: {stats['completed']} completed, {stats['failed']} failed, {stats['retried']} retried")
+    failed_jobs = sum(stats["failed"] for stats in report["jobs"].values())
+    if failed_jobs:
+        print(f"WARNING: {failed_jobs} background job(s) failed; throughput above includes them")
+    print(f"{'stage':<40} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<40} {stats['count']:>7} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} {stats['p99_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import uuid
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+# A local stand-in for the parts of the OpenAI API this repo uses: chat
+# completions and the Files/Batch endpoints. Every completion replays the same
+# canned response (rando.json by default), so extraction and backfill runs can
+# be exercised offline:
+#
+#   python3 openai_stub.py --port 8080
+#   python3 backfill.py --dir . --base-url http://localhost:8080/v1
+
+
+def make_app(response_path="rando.json", latency_ms=0, error_rate=0.0):
+    """
+    Builds the stub app. Chat completions wait `latency_ms` before answering
+    and fail with a 429 (Retry-After: 1) for `error_rate` of requests.
+    """
+    with open(response_path) as f:
+        canned_response = json.load(f)
+
+    files = {}
+    batches = {}
+
+    def completion():
+        return {**canned_response, "id": f"chatcmpl-{uuid.uuid4().hex}"}
+
+    async def chat_completions(request):
+        await request.read()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if random.random() < error_rate:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+        return web.json_response(completion())
+
+    async def upload_file(request):
+        form = await request.post()
+        file_id = f"file-{uuid.uuid4().hex}"
+        files[file_id] = form["file"].file.read()
+        return web.json_response({"id": file_id, "object": "file", "purpose": form.get("purpose")})
+
+    async def file_content(request):
+        content = files.get(request.match_info["file_id"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content, content_type="application/jsonl")
+
+    async def create_batch(request):
+        body = await request.json()
+        input_lines = files[body["input_file_id"]].decode().splitlines()
+        output = []
+        for line in input_lines:
+            if not line.strip():
+                continue
+            custom_id = json.loads(line)["custom_id"]
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": custom_id,
+                "response": {"status_code": 200, "body": completion()},
+                "error": None,
+            }))
+        output_file_id = f"file-{uuid.uuid4().hex}"
+        files[output_file_id] = "\n".join(output).encode()
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "output_file_id": output_file_id,
+            "status": "completed",
+            "request_counts": {"total": len(output), "completed": len(output), "failed": 0},
+        }
+        return web.json_response(batches[batch_id])
+
+    async def get_batch(request):
+        batch = batches.get(request.match_info["batch_id"])
+        if batch is None:
+            raise web.HTTPNotFound()
+        return web.json_response(batch)
+
+    app = web.Application(client_max_size=512 * 1024 ** 2)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/files", upload_file)
+    app.router.add_get("/v1/files/{file_id}/content", file_content)
+    app.router.add_post("/v1/batches", create_batch)
+    app.router.add_get("/v1/batches/{batch_id}", get_batch)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI API stub.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--response", default="rando.json", help="Canned chat completion to replay.")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.response, args.latency_ms, args.error_rate), port=args.port)
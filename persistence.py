@@ -0,0 +1,248 @@
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+import db_async
+from db_backends import SQLiteBotState
+
+
+class FirestoreStateStore:
+    """Keeps bot state in the db backend (Firestore in production) so every worker process shares it."""
+
+    async def load(self, kind):
+        return await db_async.get_bot_state(kind)
+
+    async def get(self, kind, key):
+        return await db_async.get_bot_state_entry(kind, key)
+
+    async def put(self, kind, key, value):
+        await db_async.set_bot_state_entry(kind, key, value)
+
+    async def delete(self, kind, key):
+        await db_async.delete_bot_state_entry(kind, key)
+
+
+class SQLiteStateStore:
+    """Keeps bot state in a local SQLite file; fast to reload on restart."""
+
+    def __init__(self, path):
+        # Queries run on worker threads, one at a time, to keep the event loop free.
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._table = SQLiteBotState(conn, threading.Lock())
+
+    async def load(self, kind):
+        return await asyncio.to_thread(self._table.load, kind)
+
+    async def get(self, kind, key):
+        return await asyncio.to_thread(self._table.get, kind, key)
+
+    async def put(self, kind, key, value):
+        await self.write_many({(kind, key): value})
+
+    async def delete(self, kind, key):
+        await self.write_many({(kind, key): None})
+
+    async def write_many(self, entries):
+        """Applies several puts (and deletes, for None values) in one transaction."""
+        await asyncio.to_thread(self._table.write_many, dict(entries))
+
+
+class WriteBehindStore:
+    """
+    Wraps a state store so writes are collected in memory and written out
+    together every `flush_interval` seconds (and on flush()). Reads see
+    pending writes.
+    """
+
+    def __init__(self, store, flush_interval=1.0):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._flush_task = None
+
+    async def load(self, kind):
+        entries = await self.store.load(kind)
+        for (pending_kind, key), value in self._pending.items():
+            if pending_kind != kind:
+                continue
+            if value is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = value
+        return entries
+
+    async def get(self, kind, key):
+        if (kind, key) in self._pending:
+            return self._pending[(kind, key)]
+        return await self.store.get(kind, key)
+
+    async def put(self, kind, key, value):
+        self._pending[(kind, key)] = value
+        self._schedule_flush()
+
+    async def delete(self, kind, key):
+        self._pending[(kind, key)] = None
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            if hasattr(self.store, "write_many"):
+                await self.store.write_many(pending)
+                return
+            for (kind, key), value in pending.items():
+                if value is None:
+                    await self.store.delete(kind, key)
+                else:
+                    await self.store.put(kind, key, value)
+        except Exception:
+            # Keep the unwritten state for the next flush, without clobbering
+            # anything newer.
+            self._pending = {**pending, **self._pending}
+            raise
+
+
+def make_state_store(backend=None):
+    """
+    Builds the state store named by `backend` or BOT_STATE_BACKEND:
+    "sqlite" (default, local file at BOT_STATE_PATH), "firestore" (shared
+    between processes) or "none".
+    """
+    backend = backend or os.getenv("BOT_STATE_BACKEND", "sqlite")
+    if backend == "none":
+        return None
+    if backend == "firestore":
+        return FirestoreStateStore()
+    if backend == "sqlite":
+        return WriteBehindStore(
+            SQLiteStateStore(os.getenv("BOT_STATE_PATH", "bot_state.sqlite3")),
+            flush_interval=float(os.getenv("BOT_STATE_FLUSH_INTERVAL_SECONDS", "1.0")),
+        )
+    raise ValueError(f"Unknown BOT_STATE_BACKEND: {backend}")
+
+
+def make_persistence(backend=None, refresh=False):
+    """Returns a StatePersistence over make_state_store(), or None if disabled."""
+    store = make_state_store(backend)
+    if store is None:
+        return None
+    return StatePersistence(store, refresh=refresh, update_interval=1)
+
+
+def _conversation_kind(name):
+    return f"conversations_{name}"
+
+
+def _conversation_key(key):
+    return json.dumps(list(key))
+
+
+class StatePersistence(BasePersistence):
+    """
+    Persists user_data and ConversationHandler state to a state store.
+
+    With refresh=True each user's data is re-read from the store before every
+    update, so a worker picks up an applicant's account_id even if another
+    worker handled their previous message.
+    """
+
+    def __init__(self, store, refresh=False, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self.refresh = refresh
+
+    async def get_user_data(self):
+        stored = await self.store.load("user_data")
+        return {int(user_id): data for user_id, data in stored.items()}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        stored = await self.store.load(_conversation_kind(name))
+        return {tuple(json.loads(key)): state for key, state in stored.items()}
+
+    async def get_conversation_state(self, name, key):
+        return await self.store.get(_conversation_kind(name), _conversation_key(key))
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            await self.store.delete(_conversation_kind(name), _conversation_key(key))
+        else:
+            await self.store.put(_conversation_kind(name), _conversation_key(key), new_state)
+
+    async def update_user_data(self, user_id, data):
+        await self.store.put("user_data", str(user_id), dict(data))
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await self.store.delete("user_data", str(user_id))
+
+    async def refresh_user_data(self, user_id, user_data):
+        if not self.refresh:
+            return
+        stored = await self.store.get("user_data", str(user_id))
+        user_data.clear()
+        if stored is not None:
+            user_data.update(stored)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if hasattr(self.store, "flush"):
+            await self.store.flush()
+
+
+class SharedConversationHandler(ConversationHandler):
+    """
+    A ConversationHandler whose state can be reloaded from persistence before
+    an update is dispatched, for deployments where several processes serve
+    the same conversations.
+    """
+
+    async def refresh_state(self, update, persistence):
+        if not self.persistent or update.effective_chat is None or update.effective_user is None:
+            return
+        key = self._get_key(update)
+        state = await persistence.get_conversation_state(self.name, key)
+        if state is None:
+            self._conversations.pop(key, None)
+        else:
+            self._conversations.update_no_track({key: state})
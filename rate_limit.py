@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+from collections import deque
+import metrics
+
+WINDOW_SECONDS = 60.0
+
+
+class RateLimiter:
+    """
+    Client-side limiter for an API with per-minute request and token quotas.
+
+    Callers reserve capacity with acquire() before sending a request, which
+    waits (in arrival order) until both budgets have room. The reservation is
+    sized from an estimate and corrected with record_usage() once the
+    response's usage block is known. pause() stops all traffic until a
+    server-provided Retry-After has passed.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, initial_estimate=1000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.estimated_tokens = initial_estimate
+        self._window = deque()  # [timestamp, tokens] per request in the last minute
+        self._tokens_in_window = 0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now):
+        while self._window and self._window[0][0] <= now - WINDOW_SECONDS:
+            self._tokens_in_window -= self._window.popleft()[1]
+
+    def _wait_time(self, now, tokens):
+        if now < self._paused_until:
+            return self._paused_until - now
+        if not self._window:
+            return 0.0
+        if len(self._window) >= self.requests_per_minute:
+            return self._window[0][0] + WINDOW_SECONDS - now
+        if self._tokens_in_window + tokens > self.tokens_per_minute:
+            # Wait for enough of the oldest requests to age out of the window.
+            excess = self._tokens_in_window + tokens - self.tokens_per_minute
+            for timestamp, used in self._window:
+                excess -= used
+                if excess <= 0:
+                    return timestamp + WINDOW_SECONDS - now
+        return 0.0
+
+    async def acquire(self, tokens=None):
+        """
+        Waits until a request of about `tokens` tokens fits in both budgets.
+
+        Returns:
+        - list: A reservation to pass to record_usage().
+        """
+        tokens = self.estimated_tokens if tokens is None else tokens
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            reservation = [now, tokens]
+            self._window.append(reservation)
+            self._tokens_in_window += tokens
+            return reservation
+
+    def record_usage(self, reservation, total_tokens):
+        """Replaces a reservation's estimate with the tokens actually used."""
+        if total_tokens is None:
+            return
+        if any(entry is reservation for entry in self._window):
+            self._tokens_in_window += total_tokens - reservation[1]
+        reservation[1] = total_tokens
+        # Exponential moving average keeps the next estimates close to reality.
+        self.estimated_tokens = int(0.8 * self.estimated_tokens + 0.2 * total_tokens)
+
+    def pause(self, seconds):
+        """Holds back every request for the next `seconds` seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def headroom(self):
+        """Requests and tokens still available in the current minute."""
+        self._prune(time.monotonic())
+        return {
+            "requests": self.requests_per_minute - len(self._window),
+            "tokens": self.tokens_per_minute - self._tokens_in_window,
+            "estimated_tokens_per_request": self.estimated_tokens,
+            "paused_for_seconds": max(self._paused_until - time.monotonic(), 0.0),
+        }
+
+
+def retry_after_seconds(headers, default=1.0):
+    """Reads a Retry-After header (in seconds), falling back to `default`."""
+    value = headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+openai_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500")),
+    tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "30000")),
+)
+
+openai_headroom = metrics.Gauge(
+    "kyc_openai_headroom", "Requests and tokens left in the current minute.", ("budget",)
+)
+
+
+def _collect():
+    headroom = openai_limiter.headroom()
+    openai_headroom.set(headroom["requests"], budget="requests")
+    openai_headroom.set(headroom["tokens"], budget="tokens")
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,122 @@
+import os
+import re
+import logging
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("SCREENING_CACHE_PATH", "screening_cache.sqlite3")
+TTL_SECONDS = float(os.getenv("SCREENING_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+_lock = threading.Lock()
+_conn = None
+# key -> future for lookups currently running, so identical concurrent
+# requests share one browse-agent run.
+_in_flight = {}
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute(
+            """CREATE TABLE IF NOT EXISTS screenings (
+                key TEXT PRIMARY KEY,
+                result_json TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+        _conn.commit()
+    return _conn
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def screening_key(name, address):
+    """
+    Cache key for a (name, address) pair; a hash, so no PII is stored in it.
+    None when there is no name, since such lookups must not share a result.
+    """
+    if not _normalize(name):
+        return None
+    normalized = f"{_normalize(name)}|{_normalize(address)}"
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def lookup(key):
+    with _lock:
+        row = _connection().execute(
+            "SELECT result_json FROM screenings WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def store(key, result):
+    with _lock:
+        conn = _connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO screenings VALUES (?, ?, ?)",
+            (key, json.dumps(result), time.time() + TTL_SECONDS),
+        )
+        conn.execute("DELETE FROM screenings WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+
+async def screen(name, address, search, should_cache=None):
+    """
+    Returns the screening result for (name, address), running `search()` only
+    when there is no fresh cached result and no identical lookup in flight.
+
+    Args:
+    - name (str): The applicant's name.
+    - address (str): The applicant's address.
+    - search: A coroutine function performing the actual screening.
+    - should_cache: Decides whether a result is worth caching. By default
+      everything but None is.
+
+    Returns:
+    - The (JSON-serializable) screening result, or None without searching
+      when the name is empty.
+    """
+    key = screening_key(name, address)
+    if key is None:
+        return None
+    if key in _in_flight:
+        return await asyncio.shield(_in_flight[key])
+
+    cached = await asyncio.to_thread(lookup, key)
+    if cached is not None:
+        logger.info("Adverse media check served from cache")
+        return cached
+
+    if key in _in_flight:  # another lookup started while we read the cache
+        return await asyncio.shield(_in_flight[key])
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        result = await search()
+        if result is not None if should_cache is None else should_cache(result):
+            await asyncio.to_thread(store, key, result)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark the exception as retrieved in case nobody else was waiting.
+        future.exception()
+        raise
+    finally:
+        del _in_flight[key]
@@ -0,0 +1,101 @@
+import io
+import os
+import hashlib
+import functools
+from ttl_cache import TTLCache
+
+# Objects larger than one chunk are sent as resumable uploads in CHUNK_SIZE
+# pieces, so a dropped connection resumes from the last committed chunk
+# instead of from zero. GCS requires chunks to be multiples of 256 KiB.
+CHUNK_QUANTUM = 256 * 1024
+CHUNK_SIZE = max(int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024))) // CHUNK_QUANTUM, 1) * CHUNK_QUANTUM
+UPLOAD_DEADLINE_SECONDS = float(os.getenv("UPLOAD_DEADLINE_SECONDS", "120"))
+
+# Uploads are idempotent (same name, same bytes), so they are always safe to
+# retry, unlike the library default which only retries with preconditions.
+# Built on first upload so importing this module does not pull in
+# google-cloud-storage.
+@functools.cache
+def upload_retry():
+    from google.cloud.storage.retry import DEFAULT_RETRY
+    return DEFAULT_RETRY.with_deadline(UPLOAD_DEADLINE_SECONDS)
+
+# name -> sha256 of what we last uploaded there, to skip even the lookup RPC
+_recent_uploads = TTLCache(max_size=10000, ttl_seconds=3600)
+
+_signatures = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+]
+
+
+def sniff_content_type(data, default="application/octet-stream"):
+    """Guesses a content type from the file's leading magic bytes."""
+    header = bytes(data[:16])
+    for signature, content_type in _signatures:
+        if header.startswith(signature):
+            return content_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return default
+
+
+def _upload(bucket, data, file_name, content_type, digest, **preconditions):
+    blob = bucket.blob(file_name, chunk_size=CHUNK_SIZE if len(data) > CHUNK_SIZE else None)
+    blob.metadata = {"sha256": digest}
+    # The server verifies the crc32c of what it received against ours.
+    blob.upload_from_file(
+        io.BytesIO(data),
+        size=len(data),
+        content_type=content_type or sniff_content_type(data),
+        checksum="crc32c",
+        retry=upload_retry(),
+        **preconditions,
+    )
+    return blob.public_url
+
+
+def upload_bytes(bucket, data, file_name, content_type=None):
+    """
+    Uploads `data` to `bucket` as `file_name`, skipping the upload when the
+    object already holds identical content (by sha256).
+
+    New names, the usual case, cost a single create-only request; only when
+    the object already exists is its content hash read to decide whether to
+    overwrite it.
+
+    Works with any google.cloud.storage bucket, including one pointed at a
+    local emulator through STORAGE_EMULATOR_HOST.
+
+    Args:
+    - bucket: The destination bucket.
+    - data (bytes): The file content.
+    - file_name (str): The object name.
+    - content_type (str): Sniffed from the content if not given.
+
+    Returns:
+    - tuple: (public url, whether an upload actually happened).
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if _recent_uploads.get(file_name) == digest:
+        return bucket.blob(file_name).public_url, False
+
+    try:
+        public_url = _upload(bucket, data, file_name, content_type, digest, if_generation_match=0)
+        uploaded = True
+    except Exception as e:
+        # 412 Precondition Failed: the object already exists.
+        if getattr(e, "code", None) != 412:
+            raise
+        existing = bucket.get_blob(file_name)
+        if existing is not None and (existing.metadata or {}).get("sha256") == digest:
+            public_url, uploaded = existing.public_url, False
+        else:
+            public_url, uploaded = _upload(bucket, data, file_name, content_type, digest), True
+    _recent_uploads.set(file_name, digest)
+    return public_url, uploaded
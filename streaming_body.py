@@ -0,0 +1,51 @@
+import json
+import base64
+
+# Bytes of the image encoded per step. A multiple of 3, so every chunk but the
+# last encodes without padding and the pieces concatenate into valid base64.
+CHUNK_SIZE = 3 * 16 * 1024
+
+# Stands in for the base64 text while the rest of the payload is serialized.
+PLACEHOLDER = "__base64_body_placeholder__"
+
+
+class Base64JsonBody:
+    """
+    A JSON request body in which one string holds base64 of a binary buffer,
+    produced chunk by chunk as the body is sent.
+
+    Only the JSON around the image and one chunk of base64 exist at a time,
+    instead of the encoded bytes, their str copy, the data URL and the
+    serialized JSON all at once. Base64 needs no JSON escaping, so the chunks
+    go out as-is.
+
+    Works as a requests body (iterable with a length) and as an aiohttp body
+    (async iterable; pass Content-Length so it is not sent chunked). Each
+    iteration starts over, so the same body can be resent on retry.
+
+    Args:
+    - payload (dict): The JSON payload, with PLACEHOLDER in the one string
+      where the base64 goes, e.g. f"data:image/jpeg;base64,{PLACEHOLDER}".
+    - data (bytes-like): The binary buffer to encode.
+    """
+
+    def __init__(self, payload, data):
+        head, found, tail = json.dumps(payload).partition(PLACEHOLDER)
+        if not found:
+            raise ValueError("payload does not contain PLACEHOLDER")
+        self._head = head.encode()
+        self._tail = tail.encode()
+        self._data = memoryview(data)
+
+    def __len__(self):
+        return len(self._head) + 4 * ((len(self._data) + 2) // 3) + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        for start in range(0, len(self._data), CHUNK_SIZE):
+            yield base64.b64encode(self._data[start:start + CHUNK_SIZE])
+        yield self._tail
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
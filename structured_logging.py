@@ -0,0 +1,101 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Log records are redacted (tracebacks included) and queued on the calling
+# thread; formatting and writing happen on a background thread so handlers
+# never block on stdout.
+#
+# LOG_LEVEL sets the default level and LOG_LEVELS overrides it per stage
+# (logger name), e.g. LOG_LEVELS="db=WARNING,id_extraction=DEBUG".
+
+# Attributes every LogRecord has; anything else came in through `extra`.
+_standard_attributes = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Fields whose values are never written out.
+PII_FIELDS = {"ssn", "email", "name", "address", "birthdate", "idNumber", "id_fields", "card_parsed"}
+
+_ssn_pattern = re.compile(r"\b\d{3}-?\d{2}-?\d{4}\b")
+_email_pattern = re.compile(r"\b([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})\b")
+
+
+def redact(text):
+    """Masks SSNs and the local part of email addresses in free text."""
+    text = _ssn_pattern.sub("***-**-****", text)
+    return _email_pattern.sub(r"\1***@\2", text)
+
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = ()
+        for key in set(vars(record)) - _standard_attributes:
+            value = getattr(record, key)
+            if key in PII_FIELDS:
+                setattr(record, key, "[redacted]")
+            elif isinstance(value, str):
+                setattr(record, key, redact(value))
+        return True
+
+
+class RedactingQueueHandler(QueueHandler):
+    """
+    Redacts again after prepare() has merged the traceback and stack into
+    the message, since exception text can carry PII too.
+    """
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.msg = redact(record.msg)
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, stage, event and any extras."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "stage": record.name,
+            "event": record.getMessage(),
+        }
+        for key in set(vars(record)) - _standard_attributes:
+            entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_listener = None
+
+
+def configure_logging():
+    """Routes all logging through the redacting queue and background writer."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RedactingQueueHandler(log_queue)
+    queue_handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # The HTTP client libraries are chatty at INFO.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    for override in filter(None, os.getenv("LOG_LEVELS", "").split(",")):
+        stage, _, level = override.partition("=")
+        logging.getLogger(stage.strip()).setLevel(level.strip().upper())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,72 +1,15 @@
-import json
-import requests
 import os
-from helpers import encode_image
-
-photo_path = "/Users/sayakmaity/fast-kyc-backend/7407996533_id_document.jpg"
-
-encoded_img = encode_image(photo_path)
-api_key = os.environ['OPENAI_API_KEY']
-headers = {
-    "Authorization": f"Bearer {api_key}",
-    "Content-Type": "application/json"
-}
-
-payload = {
-    "model": "gpt-4o",
-    "response_format": { "type": "json_object" },
-    "messages": [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": """Please process this image and output the following in JSON:
-
-                    idNumber (string)
-                    name (string)
-                    birthdate (string)
-                    sex (string)
-                    address (string)
-                    electronicReplicaOfID (boolean)
-                    paperReplicaOfID (boolean)
-                    pictureIsClear (boolean)
-                    idImageIsTampered (boolean)
-                    """
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{encoded_img}"
-                    }
-                }
-            ]
-        }
-    ],
-    "max_tokens": 300
-}
-
-response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-result = response.json()
-
-# Process the response here
-print(result)
-
-# Update the user's data with the verification results
-# This is a placeholder - implement according to your needs
-# update_verification_results(account_id, result)
-
-# Parse the outer JSON
+import json
+from id_extraction import default_extractor
 
-# Extract the content field
-content_string = result['choices'][0]['message']['content']
+photo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "7407996533_id_document.jpg")
 
-# Parse the content field
-card_parsed = json.loads(content_string)
+with open(photo_path, "rb") as image_file:
+    card = default_extractor.extract_sync(image_file.read())
 
 # Now you can access the parsed content
-print(json.dumps(content_json, indent=2))
+print(json.dumps(card.to_dict(), indent=2))
 
 # You can also access individual fields, for example:
-print(f"Name: {content_json['name']}")
-print(f"Birthdate: {content_json['birthdate']}")
\ No newline at end of file
+print(f"Name: {card.name}")
+print(f"Birthdate: {card.birthdate}")
@@ -0,0 +1,163 @@
+import os
+import re
+import logging
+import csv
+import unicodedata
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Local sanctions/PEP screening. Names from the files in WATCHLIST_PATHS
+# (comma separated; CSV with a "name" column and optional ";"-separated
+# "aliases", or plain text with one name per line) are indexed by trigram and
+# by Soundex key per token, so scoring a name only touches a handful of
+# candidates.
+
+# Verdicts returned by screen_name
+CLEAR = "clear"
+HIT = "hit"
+AMBIGUOUS = "ambiguous"
+
+HIT_THRESHOLD = float(os.getenv("WATCHLIST_HIT_THRESHOLD", "0.9"))
+CLEAR_THRESHOLD = float(os.getenv("WATCHLIST_CLEAR_THRESHOLD", "0.6"))
+# Trigrams shared by more than this share of entries are too common to
+# narrow the candidates down, so they are skipped during blocking.
+COMMON_TRIGRAM_SHARE = 0.01
+
+_soundex_codes = {}
+for letters, code in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for letter in letters:
+        _soundex_codes[letter] = code
+
+
+def normalize_name(name):
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z]+", " ", name).split())
+
+
+def soundex(token):
+    code = token[0].upper()
+    previous = _soundex_codes.get(token[0])
+    for letter in token[1:]:
+        digit = _soundex_codes.get(letter)
+        if digit is not None and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Watchlist:
+    """An in-memory fuzzy index over watchlist names."""
+
+    def __init__(self):
+        self.entries = []  # (display name, source)
+        self._names = []  # (entry index, trigrams, soundex keys) per name or alias
+        self._by_trigram = defaultdict(set)
+        self._by_soundex = defaultdict(set)
+
+    def add(self, name, source, aliases=()):
+        entry = len(self.entries)
+        self.entries.append((name, source))
+        for variant in (name, *aliases):
+            normalized = normalize_name(variant)
+            if not normalized:
+                continue
+            grams = trigrams(normalized)
+            keys = {soundex(token) for token in normalized.split()}
+            slot = len(self._names)
+            self._names.append((entry, grams, keys))
+            for gram in grams:
+                self._by_trigram[gram].add(slot)
+            for key in keys:
+                self._by_soundex[key].add(slot)
+
+    def load(self, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                for row in csv.DictReader(f):
+                    aliases = [a for a in (row.get("aliases") or "").split(";") if a.strip()]
+                    self.add(row["name"], row.get("list") or os.path.basename(path), aliases)
+            else:
+                for line in f:
+                    if line.strip():
+                        self.add(line.strip(), os.path.basename(path))
+
+    def _candidates(self, grams, keys):
+        limit = max(COMMON_TRIGRAM_SHARE * len(self._names), 50)
+        shared = defaultdict(int)
+        for gram in grams:
+            slots = self._by_trigram.get(gram, ())
+            if len(slots) <= limit:
+                for slot in slots:
+                    shared[slot] += 1
+        # One shared trigram is noise; two or more, or a shared sound, is a lead.
+        candidates = {slot for slot, count in shared.items() if count >= 2}
+        for key in keys:
+            candidates.update(self._by_soundex.get(key, ()))
+        return candidates
+
+    def best_match(self, name):
+        """
+        Finds the closest watchlist entry.
+
+        Returns:
+        - tuple: (score between 0 and 1, (name, source) or None).
+        """
+        normalized = normalize_name(name)
+        if not normalized:
+            return 0.0, None
+        grams = trigrams(normalized)
+        tokens = normalized.split()
+        keys = {soundex(token) for token in tokens}
+        best_score, best_entry = 0.0, None
+        for slot in self._candidates(grams, keys):
+            entry, other_grams, other_keys = self._names[slot]
+            dice = 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+            phonetic = len(keys & other_keys) / max(len(keys), len(other_keys))
+            score = 0.6 * dice + 0.4 * phonetic
+            if score > best_score:
+                best_score, best_entry = score, entry
+        return best_score, self.entries[best_entry] if best_entry is not None else None
+
+    def screen_name(self, name):
+        """
+        Screens a name against the watchlist.
+
+        A name that is empty once normalized (e.g. unreadable on the ID)
+        is never cleared; it comes back AMBIGUOUS.
+
+        Returns:
+        - tuple: (CLEAR, HIT or AMBIGUOUS, score, (name, source) or None).
+        """
+        if not normalize_name(name):
+            return AMBIGUOUS, 0.0, None
+        score, match = self.best_match(name)
+        if score >= HIT_THRESHOLD:
+            return HIT, score, match
+        if score < CLEAR_THRESHOLD:
+            return CLEAR, score, match
+        return AMBIGUOUS, score, match
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def load_default_watchlist():
+    watchlist = Watchlist()
+    for path in filter(None, os.getenv("WATCHLIST_PATHS", "").split(",")):
+        watchlist.load(path.strip())
+    if len(watchlist):
+        logger.info("Loaded watchlist", extra={"entries": len(watchlist)})
+    return watchlist
+
+
+default_watchlist = load_default_watchlist()
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Bot, Update
+import metrics
+from bot import build_application
+from db_async import shutdown as shutdown_db
+from persistence import make_persistence
+
+# Webhook mode: Telegram posts updates to an ASGI app, which can run as
+# several worker processes behind a load balancer. Conversation state and
+# user_data live in a shared store and are reloaded before each update, so any
+# worker can continue any applicant's flow.
+#
+#   WEBHOOK_URL=https://kyc.example.com/telegram WEBHOOK_WORKERS=4 python3 bot.py
+
+WEBHOOK_PATH = "/telegram"
+# Telegram sends this back with every update. run_webhook() generates one
+# when it is not set, and worker processes inherit it through the environment.
+SECRET_ENV = "TELEGRAM_WEBHOOK_SECRET"
+
+
+def create_app():
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    webhook_secret = os.getenv(SECRET_ENV)
+    if not webhook_secret:
+        # Without it anyone who can reach /telegram could post updates as any user
+        raise RuntimeError(f"{SECRET_ENV} must be set in webhook mode")
+    state_backend = os.getenv("BOT_STATE_BACKEND", "firestore")
+    if state_backend != "firestore":
+        # A local SQLite file or in-process state would not be seen by the other workers.
+        raise RuntimeError(f"BOT_STATE_BACKEND={state_backend} is not supported in webhook mode, use firestore")
+    persistence = make_persistence(state_backend, refresh=True)
+    application, conv_handler = build_application(token, persistence)
+
+    async def telegram(request: Request) -> Response:
+        if not secrets.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), webhook_secret):
+            return Response(status_code=403)
+        update = Update.de_json(await request.json(), application.bot)
+        await conv_handler.refresh_state(update, persistence)
+        await application.process_update(update)
+        # Write state back before acknowledging, so the applicant's next
+        # message can land on any worker.
+        await application.update_persistence()
+        return Response()
+
+    async def healthcheck(request: Request) -> PlainTextResponse:
+        return PlainTextResponse("ok")
+
+    async def metrics_endpoint(request: Request) -> Response:
+        # Per worker process; scrape each worker directly for complete numbers.
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            yield
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+        shutdown_db()
+
+    return Starlette(
+        routes=[
+            Route(WEBHOOK_PATH, telegram, methods=["POST"]),
+            Route("/healthcheck", healthcheck, methods=["GET"]),
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+async def set_webhook(token, url, secret_token):
+    async with Bot(token) as bot:
+        await bot.set_webhook(url, allowed_updates=Update.ALL_TYPES, secret_token=secret_token)
+
+
+def run_webhook(token):
+    """Registers the webhook with Telegram and serves it with uvicorn."""
+    if not os.getenv(SECRET_ENV):
+        os.environ[SECRET_ENV] = secrets.token_urlsafe(32)
+    asyncio.run(set_webhook(token, os.getenv("WEBHOOK_URL"), os.environ[SECRET_ENV]))
+    uvicorn.run(
+        "webhook:create_app",
+        factory=True,
+        host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEBHOOK_WORKERS", "1")),
+    )